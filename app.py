@@ -1,9 +1,19 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from ocr_engine import OCREngine
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from ocr_engine import OCREngine, engine_fingerprint
+from inference_pool import InferencePool, PoolBusyError, default_threads_per_worker
+from result_cache import ResultCache, content_key
+from jobs import JobRunner, JobStore, DONE
+import metrics
+from contextvars import ContextVar
+from typing import List, Optional
+import json
 import os
-import tempfile
+import threading
+import time
 import uvicorn
+import zipfile
 
 app = FastAPI(
     title="OCR API",
@@ -11,16 +21,298 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Khởi tạo OCR Engine (chỉ một lần khi khởi động)
-ocr_engine = None
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Cấu hình pool chạy OCR
+POOL_MODE = os.getenv("OCR_POOL_MODE", "thread")  # "thread" | "process"
+POOL_WORKERS = int(os.getenv("OCR_WORKERS", "1"))
+POOL_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "8"))
+POOL_RETRY_AFTER = int(os.getenv("OCR_RETRY_AFTER", "5"))
+POOL_THREADS_PER_WORKER = int(
+    os.getenv("OCR_THREADS_PER_WORKER", "0")
+) or default_threads_per_worker(POOL_WORKERS)
+
+# Cache kết quả theo nội dung file (OCR_CACHE_MB=0 để tắt)
+CACHE_MB = int(os.getenv("OCR_CACHE_MB", "64"))
+result_cache = ResultCache(
+    max_bytes=CACHE_MB * 1024 * 1024,
+    disk_dir=os.getenv("OCR_CACHE_DIR") or None,
+    disk_max_bytes=int(os.getenv("OCR_CACHE_DISK_MB", "1024")) * 1024 * 1024,
+) if CACHE_MB > 0 else None
+
+# Cấu hình OCR Engine qua biến môi trường
+ENGINE_OPTIONS = {
+    "rec_batch_size": int(os.getenv("OCR_REC_BATCH_SIZE", "16")),
+    "rec_bucket_width": int(os.getenv("OCR_REC_BUCKET_WIDTH", "0")),
+    "det_only": _env_bool("OCR_DET_ONLY", False),
+    "use_angle_cls": _env_bool("OCR_USE_ANGLE_CLS", True),
+    "orientation": os.getenv("OCR_ORIENTATION", "off"),
+    "cpu_threads": POOL_THREADS_PER_WORKER,
+    "rec_page_window": int(os.getenv("OCR_REC_PAGE_WINDOW", "4")),
+    "pdf_prefetch": int(os.getenv("OCR_PDF_PREFETCH", "2")),
+    "pdf_text_layer": _env_bool("OCR_PDF_TEXT_LAYER", True),
+    "blank_filter": _env_bool("OCR_BLANK_FILTER", True),
+    "blank_ink_ratio": float(os.getenv("OCR_BLANK_INK_RATIO", "0.0003")),
+    "blank_faint_ratio": float(os.getenv("OCR_BLANK_FAINT_RATIO", "0.02")),
+    "sparse_ink_ratio": float(os.getenv("OCR_SPARSE_INK_RATIO", "0.01")),
+    "det_tile_size": int(os.getenv("OCR_DET_TILE_SIZE", "0")),
+    "det_tile_overlap": int(os.getenv("OCR_DET_TILE_OVERLAP", "128")),
+    "det_tile_batch": int(os.getenv("OCR_DET_TILE_BATCH", "4")),
+    "cascade": _env_bool("OCR_CASCADE", False),
+    "cascade_min_score": float(os.getenv("OCR_CASCADE_MIN_SCORE", "0.95")),
+    "cascade_max_letter_ratio": float(os.getenv("OCR_CASCADE_MAX_LETTER_RATIO", "0.5")),
+    "crop_cache_size": int(os.getenv("OCR_CROP_CACHE_SIZE", "0")),
+    "crop_cache_scope": os.getenv("OCR_CROP_CACHE_SCOPE", "document"),
+    "crop_padding": int(os.getenv("OCR_CROP_PADDING", "0")),
+    "min_box_size": int(os.getenv("OCR_MIN_BOX_SIZE", "3")),
+    "rectify_min_angle": float(os.getenv("OCR_RECTIFY_MIN_ANGLE", "3")),
+    "result_cache": result_cache,
+    "backend": os.getenv("OCR_BACKEND", "native"),
+    "onnx_dir": os.getenv("OCR_ONNX_DIR", "onnx_models"),
+    "rec_quantize": os.getenv("OCR_REC_QUANTIZE", "none"),
+    "model_dir": os.getenv("OCR_MODEL_DIR") or None,
+}
+# Chạy thử OCR trên ảnh mẫu trong mỗi worker trước khi báo ready
+WARMUP = _env_bool("OCR_WARMUP", True)
+ENGINE_FINGERPRINT = engine_fingerprint(**ENGINE_OPTIONS)
+
+# Job bất đồng bộ cho tài liệu lớn (lưu trong SQLite, sống qua restart)
+JOBS_DIR = os.getenv("OCR_JOBS_DIR", "jobs_data")
+JOB_CONSUMERS = int(os.getenv("OCR_JOB_CONSUMERS", "1"))
+JOB_LEASE_S = float(os.getenv("OCR_JOB_LEASE_S", "60"))
+
+# Giới hạn cho /ocr/batch
+BATCH_MAX_FILES = int(os.getenv("OCR_BATCH_MAX_FILES", "200"))
+BATCH_MAX_MB = int(os.getenv("OCR_BATCH_MAX_MB", "200"))
+
+# Pool OCR (khởi tạo một lần khi khởi động), OCR chạy trong worker
+# để không chặn event loop. Chỉ được gán khi mọi worker đã load model và
+# warm-up xong (None = chưa sẵn sàng).
+ocr_pool = None
+job_runner = None
+# Tạo trong startup (không tạo thư mục job lúc import module)
+job_store = None
+startup_state = {"status": "starting", "error": None, "started_at": time.time(), "ready_s": None}
+
+def _wait_pool(pool: InferencePool):
+    """Chờ worker warm-up xong (chạy trong thread nền để server trả lời ngay)"""
+    global ocr_pool, job_runner
+    try:
+        pool.wait_ready()
+        ocr_pool = pool
+        job_runner = JobRunner(job_store, ocr_pool, consumers=JOB_CONSUMERS)
+        job_runner.start()
+    except Exception as e:
+        startup_state.update(status="failed", error=str(e))
+        print(f"❌ Failed to load OCR engine: {e}")
+        return
+    startup_state.update(status="ready", ready_s=time.time() - startup_state["started_at"])
+    print(f"✅ Server ready! ({startup_state['ready_s']:.1f}s)")
 
 @app.on_event("startup")
 async def startup_event():
-    """Khởi tạo OCR Engine khi server khởi động"""
-    global ocr_engine
+    """
+    Khởi tạo OCR Engine khi server khởi động. Worker được tạo ngay tại đây
+    (main thread, chưa có thread nào khác): ở chế độ process việc này gồm
+    load model rồi fork nên chặn đến khi fork xong. Warm-up trong các worker
+    chạy trong nền, không chặn việc nhận request.
+    """
+    global job_store
     print("🚀 Starting OCR API Server...")
-    ocr_engine = OCREngine()
-    print("✅ Server ready!")
+    job_store = JobStore(JOBS_DIR, lease_seconds=JOB_LEASE_S)
+    pool = InferencePool(
+        lambda: OCREngine(**ENGINE_OPTIONS),
+        workers=POOL_WORKERS,
+        max_queue=POOL_MAX_QUEUE,
+        retry_after=POOL_RETRY_AFTER,
+        mode=POOL_MODE,
+        threads_per_worker=POOL_THREADS_PER_WORKER,
+        warmup=WARMUP,
+    )
+    try:
+        pool.launch()
+    except Exception as e:
+        startup_state.update(status="failed", error=str(e))
+        print(f"❌ Failed to load OCR engine: {e}")
+        return
+    threading.Thread(target=_wait_pool, args=(pool,), name="ocr-startup", daemon=True).start()
+
+def _require_pool():
+    """503 + Retry-After khi model chưa load xong"""
+    if ocr_pool is None:
+        raise HTTPException(
+            status_code=503,
+            detail="OCR engine đang khởi động" if startup_state["status"] == "starting"
+            else f"OCR engine lỗi khi khởi động: {startup_state['error']}",
+            headers={"Retry-After": str(POOL_RETRY_AFTER)},
+        )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if job_runner is not None:
+        job_runner.stop()
+    if ocr_pool is not None:
+        ocr_pool.shutdown()
+
+# ----------------- METRICS -----------------
+# Thời điểm nhận request (đặt trong middleware) để đo thời gian đọc upload
+_request_started: ContextVar[Optional[float]] = ContextVar("request_started", default=None)
+
+def _pool_gauge(field: str):
+    def read():
+        return {(): ocr_pool.stats()[field]} if ocr_pool is not None else None
+    return read
+
+def _cache_gauge(field: str):
+    def read():
+        return {(): result_cache.stats()[field]} if result_cache is not None else None
+    return read
+
+for _field in ("queued", "in_flight", "completed", "failed", "rejected"):
+    metrics.registry.gauge(f"ocr_pool_{_field}", f"InferencePool: {_field}", _pool_gauge(_field))
+for _field in ("hits", "disk_hits", "misses", "memory_bytes", "disk_bytes"):
+    metrics.registry.gauge(f"ocr_cache_{_field}", f"Cache kết quả: {_field}", _cache_gauge(_field))
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Đếm request và đo thời gian các endpoint /ocr/*"""
+    path = request.url.path
+    if not path.startswith("/ocr/"):
+        return await call_next(request)
+    start = time.perf_counter()
+    _request_started.set(start)
+    try:
+        response = await call_next(request)
+    except Exception:
+        metrics.REQUESTS.inc(endpoint=path, status="500")
+        raise
+    metrics.REQUESTS.inc(endpoint=path, status=str(response.status_code))
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=path)
+    return response
+
+async def _read_upload(file: UploadFile, endpoint: str):
+    """
+    File upload đã được Starlette spool trong lúc parse multipart (bộ nhớ nếu
+    nhỏ, file tạm trên đĩa nếu lớn) → không đọc lại thành bytes.
+    Trả về (file-like object, thời gian tính từ lúc nhận request đến khi
+    upload sẵn sàng — chính là phần parse multipart của FastAPI).
+    """
+    await file.seek(0)
+    started = _request_started.get()
+    upload_read = time.perf_counter() - started if started is not None else 0.0
+    metrics.UPLOAD_READ_SECONDS.observe(upload_read, endpoint=endpoint)
+    return file.file, upload_read
+
+async def _upload_key(upload) -> str:
+    """Key cache của file upload, hash từng khối trong threadpool (không chặn event loop)"""
+    return await run_in_threadpool(content_key, upload, ENGINE_FINGERPRINT)
+
+async def _engine_input(upload):
+    """
+    Thread mode: engine đọc thẳng file upload (PDF lớn được MuPDF đọc từ file
+    tạm, ảnh được PIL đọc dần) — không có bản copy nào của cả file trong bộ
+    nhớ. Process mode: nội dung vẫn phải pickle sang worker process nên đọc
+    thành bytes.
+    """
+    if POOL_MODE != "process":
+        return upload
+    upload.seek(0)
+    return await run_in_threadpool(upload.read)
+
+def _timings_block(upload_read: float, measurement: Optional[dict]) -> dict:
+    """Khối `timings` (giây) trả về khi gọi endpoint với ?timings=true"""
+    block = {"upload_read": round(upload_read, 4)}
+    if measurement is not None:
+        if measurement["queue_wait"] is not None:
+            block["queue_wait"] = round(measurement["queue_wait"], 4)
+        block["stages"] = {k: round(v, 4) for k, v in measurement["timings"].items()}
+        block["boxes"] = sum(measurement["samples"].get("boxes_per_page", []))
+    started = _request_started.get()
+    if started is not None:
+        block["total"] = round(time.perf_counter() - started, 4)
+    return block
+
+def _crop_cache_block(measurement: Optional[dict]) -> Optional[dict]:
+    """
+    Số lần tra cache crop dòng của request (None nếu không bật / không OCR).
+    Tách riêng với `cached` (cache kết quả cả tài liệu) và khối `timings`.
+    """
+    if measurement is None or "crop_cache_hits" not in measurement["samples"]:
+        return None
+    hits = sum(measurement["samples"]["crop_cache_hits"])
+    duplicates = sum(measurement["samples"]["crop_cache_duplicates"])
+    misses = sum(measurement["samples"]["crop_cache_misses"])
+    lookups = hits + duplicates + misses
+    return {
+        "hits": hits,
+        "duplicates": duplicates,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+    }
+
+async def _run_ocr(method: str, *args, **kwargs):
+    """
+    Gửi việc OCR vào pool, trả 503 + Retry-After nếu hàng đợi đầy.
+    Trả về (kết quả, số liệu đo của OCREngine.measure).
+    """
+    _require_pool()
+    try:
+        measurement = await ocr_pool.run(
+            "measure", method, *args, submitted_at=time.time(), **kwargs
+        )
+    except PoolBusyError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    metrics.observe_measurement(measurement)
+    return measurement["result"], measurement
+
+async def _run_ocr_cached(method: str, upload):
+    """
+    Tra cache theo nội dung upload trước khi xếp hàng OCR. Engine đọc thẳng
+    từ file upload đã spool (xem `_engine_input`), không ghi file tạm.
+    Trả về (kết quả, có lấy từ cache hay không, số liệu đo hoặc None).
+    """
+    key = None
+    if result_cache is not None:
+        key = await _upload_key(upload)
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached, True, None
+
+    # Engine không cần tra cache tài liệu lần nữa (vẫn dùng cache mức trang)
+    result, measurement = await _run_ocr(method, await _engine_input(upload), use_cache=False)
+    metrics.observe_pages(result)
+    if key is not None:
+        result_cache.put(key, result)
+    return result, False, measurement
+
+def _page_summary(result: dict) -> list:
+    """Mỗi trang lấy text từ đâu: text_layer / ocr / mixed / blank"""
+    return [
+        {"page": page["page"], "source": page["source"]}
+        for page in result["pages"]
+    ]
+
+def _blank_pages(result: dict) -> int:
+    """Số trang trắng được bỏ qua, không chạy OCR"""
+    return sum(1 for page in result["pages"] if page["source"] == "blank")
+
+def _tier_counts(result: dict) -> Optional[dict]:
+    """Số dòng nhận dạng ở mỗi tầng (chế độ cascade), None nếu không bật"""
+    tiers = [page["tiers"] for page in result["pages"] if "tiers" in page]
+    if not tiers:
+        return None
+    return {
+        "paddle": sum(t["paddle"] for t in tiers),
+        "vietocr": sum(t["vietocr"] for t in tiers),
+    }
 
 @app.get("/")
 async def root():
@@ -30,12 +322,61 @@ async def root():
         "endpoints": {
             "/ocr/image": "Upload file PNG/JPG để OCR",
             "/ocr/pdf": "Upload file PDF để OCR",
-            "/ocr/auto": "Upload file tự động nhận diện (PDF/PNG/JPG)"
+            "/ocr/auto": "Upload file tự động nhận diện (PDF/PNG/JPG)",
+            "/ocr/stream": "OCR và trả kết quả từng trang ngay khi xong (NDJSON / SSE)",
+            "/ocr/batch": "Upload nhiều file hoặc một file ZIP, OCR chung một lượt",
+            "/jobs": "Tạo job OCR bất đồng bộ cho tài liệu lớn (PDF/PNG/JPG)",
+            "/jobs/{job_id}": "Trạng thái và tiến độ job (GET) / huỷ job (DELETE)",
+            "/jobs/{job_id}/result": "Kết quả job đã xong",
+            "/status": "Trạng thái hàng đợi OCR (queued / in_flight)",
+            "/health/live": "Liveness: process đang chạy",
+            "/health/ready": "Readiness: model đã load và warm-up xong",
+            "/metrics": "Metric dạng Prometheus (thời gian từng bước, hàng đợi, cache)"
         }
     }
 
+@app.get("/health/live")
+async def health_live():
+    """Liveness probe: luôn 200 khi process còn trả lời được"""
+    return {"status": "alive", "uptime_s": round(time.time() - startup_state["started_at"], 1)}
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness probe: 200 khi mọi worker đã load model và warm-up xong"""
+    body = {
+        "status": startup_state["status"],
+        "warmup": WARMUP,
+        "workers": POOL_WORKERS,
+    }
+    if startup_state["status"] != "ready":
+        if startup_state["error"]:
+            body["error"] = startup_state["error"]
+        return JSONResponse(body, status_code=503)
+    body["startup_s"] = round(startup_state["ready_s"], 2)
+    return body
+
+@app.get("/status")
+async def status():
+    """Độ sâu hàng đợi và số request đang chạy, cho load balancer"""
+    if ocr_pool is None:
+        return JSONResponse({"ready": False}, status_code=503)
+    stats = ocr_pool.stats()
+    stats["ready"] = True
+    stats["busy"] = ocr_pool.is_busy()
+    if result_cache is not None:
+        stats["cache"] = result_cache.stats()
+    stats["jobs"] = job_store.counts()
+    return stats
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Metric dạng Prometheus text format"""
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
 @app.post("/ocr/image")
-async def ocr_image(file: UploadFile = File(...)):
+async def ocr_image(file: UploadFile = File(...), timings: bool = Query(False)):
     """
     OCR file hình ảnh (PNG, JPG, JPEG)
     """
@@ -49,32 +390,36 @@ async def ocr_image(file: UploadFile = File(...)):
             detail=f"Định dạng file không được hỗ trợ. Chỉ chấp nhận: {', '.join(allowed_extensions)}"
         )
     
-    # Lưu file tạm
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
+    upload, upload_read = await _read_upload(file, "/ocr/image")
+
     try:
         # Thực hiện OCR
-        text = ocr_engine.ocr_image(tmp_path)
+        result, cached, measurement = await _run_ocr_cached("ocr_image_detailed", upload)
+        text = result["text"]
         
-        return JSONResponse({
+        response = {
             "success": True,
             "filename": file.filename,
             "file_type": "image",
             "text": text,
-            "text_length": len(text)
-        })
+            "text_length": len(text),
+            "blank_pages": _blank_pages(result),
+            "tiers": _tier_counts(result),
+            "cached": cached
+        }
+        crop_cache = _crop_cache_block(measurement)
+        if crop_cache is not None:
+            response["crop_cache"] = crop_cache
+        if timings:
+            response["timings"] = _timings_block(upload_read, measurement)
+        return JSONResponse(response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý OCR: {str(e)}")
-    finally:
-        # Xóa file tạm
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
 
 @app.post("/ocr/pdf")
-async def ocr_pdf(file: UploadFile = File(...)):
+async def ocr_pdf(file: UploadFile = File(...), timings: bool = Query(False)):
     """
     OCR file PDF
     """
@@ -87,32 +432,37 @@ async def ocr_pdf(file: UploadFile = File(...)):
             detail="Định dạng file không được hỗ trợ. Chỉ chấp nhận file PDF."
         )
     
-    # Lưu file tạm
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
+    upload, upload_read = await _read_upload(file, "/ocr/pdf")
+
     try:
         # Thực hiện OCR
-        text = ocr_engine.ocr_pdf(tmp_path)
+        result, cached, measurement = await _run_ocr_cached("ocr_pdf_detailed", upload)
+        text = result["text"]
         
-        return JSONResponse({
+        response = {
             "success": True,
             "filename": file.filename,
             "file_type": "pdf",
             "text": text,
-            "text_length": len(text)
-        })
+            "text_length": len(text),
+            "pages": _page_summary(result),
+            "blank_pages": _blank_pages(result),
+            "tiers": _tier_counts(result),
+            "cached": cached
+        }
+        crop_cache = _crop_cache_block(measurement)
+        if crop_cache is not None:
+            response["crop_cache"] = crop_cache
+        if timings:
+            response["timings"] = _timings_block(upload_read, measurement)
+        return JSONResponse(response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý OCR: {str(e)}")
-    finally:
-        # Xóa file tạm
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
 
 @app.post("/ocr/auto")
-async def ocr_auto(file: UploadFile = File(...)):
+async def ocr_auto(file: UploadFile = File(...), timings: bool = Query(False)):
     """
     OCR file tự động nhận diện định dạng (PDF, PNG, JPG, JPEG)
     """
@@ -125,29 +475,326 @@ async def ocr_auto(file: UploadFile = File(...)):
             detail=f"Định dạng file không được hỗ trợ. Chỉ chấp nhận: {', '.join(allowed_extensions)}"
         )
     
-    # Lưu file tạm
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
+    upload, upload_read = await _read_upload(file, "/ocr/auto")
+
     try:
         # Thực hiện OCR tự động
-        text = ocr_engine.process_file(tmp_path)
+        result, cached, measurement = await _run_ocr_cached("process_file_detailed", upload)
+        text = result["text"]
         
-        return JSONResponse({
+        response = {
             "success": True,
             "filename": file.filename,
             "file_type": file_ext[1:],  # Bỏ dấu chấm
             "text": text,
-            "text_length": len(text)
-        })
+            "text_length": len(text),
+            "pages": _page_summary(result),
+            "blank_pages": _blank_pages(result),
+            "tiers": _tier_counts(result),
+            "cached": cached
+        }
+        crop_cache = _crop_cache_block(measurement)
+        if crop_cache is not None:
+            response["crop_cache"] = crop_cache
+        if timings:
+            response["timings"] = _timings_block(upload_read, measurement)
+        return JSONResponse(response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý OCR: {str(e)}")
-    finally:
-        # Xóa file tạm
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+
+def _batch_items(files: List[UploadFile]) -> List[tuple]:
+    """
+    Danh sách (tên, nội dung) cần OCR từ các file upload; file ZIP được giải
+    nén (bỏ file không phải PDF/PNG/JPG). Tên trùng được thêm hậu tố "#n".
+    Giới hạn số file / dung lượng được kiểm tra trước khi đọc nội dung: kích
+    thước file upload lấy từ file đã spool, của file trong ZIP từ central
+    directory. Nội dung là file upload (file-like, không đọc lại) hoặc bytes
+    của file giải nén từ ZIP. Chạy trong threadpool (đọc / giải nén đồng bộ).
+    """
+    allowed_extensions = ['.pdf', '.png', '.jpg', '.jpeg']
+    max_bytes = BATCH_MAX_MB * 1024 * 1024
+    too_large = HTTPException(status_code=413, detail=f"Batch vượt quá {BATCH_MAX_MB} MB")
+    too_many = HTTPException(status_code=413, detail=f"Batch vượt quá {BATCH_MAX_FILES} file")
+    if len(files) > BATCH_MAX_FILES:
+        raise too_many
+    items = []
+    total = 0
+    for file in files:
+        filename, upload = file.filename, file.file
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == ".zip":
+            upload.seek(0)
+            try:
+                # Chỉ đọc central directory, chưa giải nén gì
+                archive = zipfile.ZipFile(upload)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"File ZIP không hợp lệ: {filename}")
+            with archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    if (
+                        info.is_dir()
+                        or name.startswith("__MACOSX/")
+                        or os.path.splitext(name)[1].lower() not in allowed_extensions
+                    ):
+                        continue
+                    # Kiểm tra kích thước giải nén trước khi đọc (chống zip bomb)
+                    total += info.file_size
+                    if total > max_bytes:
+                        raise too_large
+                    if len(items) >= BATCH_MAX_FILES:
+                        raise too_many
+                    items.append((name, archive.read(info)))
+        elif ext in allowed_extensions:
+            total += upload.seek(0, os.SEEK_END)
+            upload.seek(0)
+            if total > max_bytes:
+                raise too_large
+            if len(items) >= BATCH_MAX_FILES:
+                raise too_many
+            items.append((filename, upload))
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Định dạng file không được hỗ trợ: {filename}. Chỉ chấp nhận: {', '.join(allowed_extensions + ['.zip'])}"
+            )
+
+    seen = {}
+    unique = []
+    for name, content in items:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append((name if seen[name] == 1 else f"{name}#{seen[name]}", content))
+    return unique
+
+@app.post("/ocr/batch")
+async def ocr_batch(files: List[UploadFile] = File(...), timings: bool = Query(False)):
+    """
+    OCR nhiều file (PDF, PNG, JPG, JPEG) hoặc một/nhiều file ZIP trong một
+    request. Trang của mọi file được nhận dạng chung batch; kết quả trả theo
+    tên file. `timings.upload_read` là tổng cho cả batch (parse multipart của
+    mọi file + giải nén ZIP).
+    """
+    _, upload_read = await _read_upload(files[0], "/ocr/batch")
+    read_start = time.perf_counter()
+    items = await run_in_threadpool(_batch_items, files)
+    upload_read += time.perf_counter() - read_start
+    if not items:
+        raise HTTPException(status_code=400, detail="Không có file PDF/PNG/JPG nào để OCR")
+
+    results = {}
+    pending = []
+    measurement = None
+    for name, content in items:
+        key = await _upload_key(content) if result_cache is not None else None
+        cached = result_cache.get(key) if key is not None else None
+        if cached is not None:
+            results[name] = (cached, True)
+        else:
+            pending.append((name, content, key))
+
+    try:
+        if pending:
+            batch, measurement = await _run_ocr(
+                "ocr_batch_detailed",
+                [
+                    content if isinstance(content, bytes) else await _engine_input(content)
+                    for _, content, _ in pending
+                ],
+                use_cache=False,
+            )
+            for (name, _, key), result in zip(pending, batch):
+                if "error" not in result:
+                    metrics.observe_pages(result)
+                    if key is not None:
+                        result_cache.put(key, result)
+                results[name] = (result, False)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý OCR: {str(e)}")
+
+    response = {}
+    for name, _ in items:
+        result, cached = results[name]
+        if "error" in result:
+            response[name] = {"success": False, "error": result["error"]}
+            continue
+        response[name] = {
+            "success": True,
+            "text": result["text"],
+            "text_length": len(result["text"]),
+            "pages": _page_summary(result),
+            "blank_pages": _blank_pages(result),
+            "tiers": _tier_counts(result),
+            "cached": cached,
+        }
+    body = {
+        "success": all(item["success"] for item in response.values()),
+        "count": len(response),
+        "files": response,
+    }
+    crop_cache = _crop_cache_block(measurement)
+    if crop_cache is not None:
+        body["crop_cache"] = crop_cache
+    if timings:
+        body["timings"] = _timings_block(upload_read, measurement)
+    return JSONResponse(body)
+
+def _stream_event(kind: str, data: dict, fmt: str) -> str:
+    """Một record của stream: một dòng JSON (NDJSON) hoặc một event SSE"""
+    payload = json.dumps(dict(data, type=kind), ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {kind}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+@app.post("/ocr/stream")
+async def ocr_stream(
+    file: UploadFile = File(...),
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+):
+    """
+    OCR file (PDF, PNG, JPG, JPEG) và trả kết quả từng trang ngay khi trang đó
+    xong thay vì chờ cả tài liệu:
+        {"type": "page", "page", "total", "source", "text", "elapsed_s"}
+        ...
+        {"type": "done", "pages", "blank_pages", "tiers", "text_length", "elapsed_s", "cached"}
+    Lỗi giữa chừng trả record {"type": "error", "detail"} rồi kết thúc.
+    """
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    allowed_extensions = ['.pdf', '.png', '.jpg', '.jpeg']
+
+    if file_ext not in allowed_extensions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Định dạng file không được hỗ trợ. Chỉ chấp nhận: {', '.join(allowed_extensions)}"
+        )
+
+    start = _request_started.get() or time.perf_counter()
+    upload, _ = await _read_upload(file, "/ocr/stream")
+    # FastAPI đóng file upload ngay khi handler trả về, trước khi stream xong
+    # → stream phải giữ bản nội dung riêng
+    content = await run_in_threadpool(upload.read)
+    key = None
+    cached = None
+    if result_cache is not None:
+        key = content_key(content, ENGINE_FINGERPRINT)
+        cached = result_cache.get(key)
+
+    records = None
+    if cached is None:
+        _require_pool()
+        try:
+            # Gửi vào pool ngay để hàng đợi đầy vẫn trả được 503 trước khi stream
+            records = ocr_pool.stream(
+                "measure", "process_file_detailed", content,
+                use_cache=False, submitted_at=time.time(),
+            )
+        except PoolBusyError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)},
+            )
+
+    async def events():
+        try:
+            if records is None:
+                total = len(cached["pages"])
+                for page in cached["pages"]:
+                    yield _stream_event("page", dict(page, total=total, elapsed_s=0.0), format)
+                result = cached
+            else:
+                result = None
+                async for kind, item in records:
+                    if kind == "page":
+                        item["elapsed_s"] = round(time.perf_counter() - start, 3)
+                        yield _stream_event("page", item, format)
+                    else:
+                        metrics.observe_measurement(item)
+                        result = item["result"]
+                        metrics.observe_pages(result)
+                if key is not None:
+                    result_cache.put(key, result)
+            yield _stream_event("done", {
+                "pages": len(result["pages"]),
+                "blank_pages": _blank_pages(result),
+                "tiers": _tier_counts(result),
+                "text_length": len(result["text"]),
+                "elapsed_s": round(time.perf_counter() - start, 3),
+                "cached": records is None,
+            }, format)
+        except Exception as e:
+            yield _stream_event("error", {"detail": f"Lỗi khi xử lý OCR: {str(e)}"}, format)
+        finally:
+            if records is not None:
+                await records.aclose()
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...)):
+    """
+    Tạo job OCR bất đồng bộ (PDF, PNG, JPG, JPEG), trả về job_id ngay.
+    Theo dõi tiến độ qua GET /jobs/{job_id}.
+    """
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    allowed_extensions = ['.pdf', '.png', '.jpg', '.jpeg']
+
+    if file_ext not in allowed_extensions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Định dạng file không được hỗ trợ. Chỉ chấp nhận: {', '.join(allowed_extensions)}"
+        )
+
+    await file.seek(0)
+    # Copy từng khối từ file upload đã spool sang thư mục job
+    job_id = await run_in_threadpool(job_store.submit, file.filename, file.file)
+    if job_runner is not None:
+        job_runner.notify()
+    return job_store.get(job_id)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Trạng thái job: queued / running / cancelling / done / failed / cancelled"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Kết quả OCR của job đã xong"""
+    job = job_store.get(job_id, with_result=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    if job["status"] != DONE:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job chưa có kết quả (trạng thái: {job['status']})"
+        )
+    result = job.pop("result")
+    text = result["text"]
+    return JSONResponse({
+        "success": True,
+        "job_id": job_id,
+        "filename": job["filename"],
+        "text": text,
+        "text_length": len(text),
+        "pages": _page_summary(result),
+        "blank_pages": _blank_pages(result),
+        "tiers": _tier_counts(result)
+    })
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Huỷ job: job đang chờ bị huỷ ngay, job đang chạy dừng sau trang hiện tại"""
+    status = job_store.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return {"job_id": job_id, "status": status}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,312 @@
+"""
+Benchmark tái lập được cho toàn bộ pipeline OCR.
+
+Sinh bộ dữ liệu tổng hợp tiếng Việt (ảnh và PDF nhiều trang, nhiều mật độ chữ
+và độ phân giải, có ground truth) rồi chạy qua OCREngine (hoặc API HTTP đang
+chạy), báo cáo cho từng nhóm: pages/sec, latency p50/p95/p99 mỗi tài liệu, CER
+so với ground truth; kèm peak RSS của process (chỉ khi gọi engine trực tiếp,
+với `--url` RSS của client không nói gì về server). Kết quả ghi ra JSON để so sánh
+giữa các lần chạy; truyền `--baseline` để thoát với mã lỗi khi chậm đi hoặc
+CER tăng quá ngưỡng.
+
+    python bench_pipeline.py --out bench_results.json
+    python bench_pipeline.py --baseline bench_results.json --out new.json
+    python bench_pipeline.py --url http://localhost:8000 --unique --out http.json
+
+Cần một font TrueType có dấu tiếng Việt (mặc định tìm DejaVuSans / Arial /
+Noto Sans trong hệ thống, hoặc truyền `--font`).
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+
+from evaluation import cer, percentile
+
+# Từ vựng để sinh câu tiếng Việt (đủ các dấu thanh và chữ ă â ê ô ơ ư đ)
+WORDS = (
+    "công ty cổ phần hợp đồng mua bán hàng hoá thanh toán chuyển khoản ngân hàng "
+    "số tiền bằng chữ đồng việt nam ngày tháng năm địa chỉ điện thoại mã số thuế "
+    "người đại diện giám đốc kế toán trưởng hoá đơn giá trị gia tăng đơn vị tính "
+    "số lượng đơn giá thành tiền cộng tiền hàng thuế suất tổng cộng phường quận "
+    "thành phố hồ chí minh hà nội đà nẵng cần thơ hải phòng biên bản bàn giao "
+    "nghiệm thu quyết định thông báo kết quả đề nghị xác nhận chữ ký họ tên "
+    "trường đại học bách khoa khoa học kỹ thuật sinh viên giảng viên lớp học"
+).split()
+
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+)
+
+# Nhóm dữ liệu: (tên, loại, số dòng mỗi trang, độ rộng trang px, số trang)
+CASES = (
+    ("image_sparse_150dpi", "image", 6, 1240, 1),
+    ("image_dense_150dpi", "image", 30, 1240, 1),
+    ("image_dense_300dpi", "image", 30, 2480, 1),
+    ("pdf_scan_5p", "pdf_scan", 20, 1240, 5),
+    ("pdf_text_5p", "pdf_text", 20, 1240, 5),
+)
+
+_PAGE_HEADER = re.compile(r"^--- Trang \d+ ---$", re.MULTILINE)
+
+
+# ----------------- SINH DỮ LIỆU -----------------
+def find_font(path: Optional[str] = None) -> str:
+    for candidate in ((path,) if path else FONT_CANDIDATES):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(
+        "Không tìm thấy font TrueType có dấu tiếng Việt, truyền --font <file.ttf>"
+    )
+
+
+def random_lines(rng: random.Random, count: int) -> List[str]:
+    lines = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 10))]
+        if rng.random() < 0.4:
+            words.append(str(rng.randint(1, 999999)))
+        line = " ".join(words)
+        lines.append(line[0].upper() + line[1:])
+    return lines
+
+
+def render_page(lines: List[str], width: int, font_path: str):
+    """Ảnh trang giấy trắng chữ đen, tỉ lệ A4."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    height = int(width * 1.414)
+    scale = width / 1240
+    font = ImageFont.truetype(font_path, int(24 * scale))
+    margin = int(80 * scale)
+    step = int(40 * scale)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * step), line, fill="black", font=font)
+    return img
+
+
+def generate_case(case, out_dir: str, docs: int, font_path: str, seed: int) -> List[Dict]:
+    """
+    Sinh `docs` tài liệu cho một nhóm, trả về [{"path", "pages", "truth"}].
+    """
+    import fitz
+
+    name, kind, lines_per_page, width, pages = case
+    rng = random.Random(f"{seed}:{name}")
+    case_dir = os.path.join(out_dir, name)
+    os.makedirs(case_dir, exist_ok=True)
+    items = []
+    for doc_idx in range(docs):
+        page_lines = [random_lines(rng, lines_per_page) for _ in range(pages)]
+        truth = "\n".join("\n".join(lines) for lines in page_lines)
+        if kind == "image":
+            path = os.path.join(case_dir, f"{doc_idx:03d}.png")
+            if not os.path.exists(path):
+                render_page(page_lines[0], width, font_path).save(path)
+        else:
+            path = os.path.join(case_dir, f"{doc_idx:03d}.pdf")
+            if not os.path.exists(path):
+                doc = fitz.open()
+                for lines in page_lines:
+                    page = doc.new_page(width=595, height=842)  # A4, point
+                    if kind == "pdf_scan":
+                        buf = io.BytesIO()
+                        render_page(lines, width, font_path).save(buf, format="PNG")
+                        page.insert_image(page.rect, stream=buf.getvalue())
+                    else:
+                        page.insert_font(fontname="vn", fontfile=font_path)
+                        for i, line in enumerate(lines):
+                            page.insert_text((40, 60 + i * 20), line, fontname="vn", fontsize=12)
+                doc.save(path)
+                doc.close()
+        items.append({"path": path, "pages": pages, "truth": truth})
+    return items
+
+
+# ----------------- CHẠY -----------------
+class EngineRunner:
+    def __init__(self, engine_options: Dict):
+        from ocr_engine import OCREngine
+
+        self.engine = OCREngine(**engine_options)
+        self.timings: Dict[str, float] = {}
+
+    def run(self, path: str) -> str:
+        return self.engine.process_file_detailed(path, self.timings, use_cache=False)["text"]
+
+
+class HttpRunner:
+    def __init__(self, url: str, unique: bool = False):
+        import requests
+
+        self.session = requests.Session()
+        self.url = url.rstrip("/")
+        self.unique = unique
+        self.timings: Dict[str, float] = {}
+
+    def run(self, path: str) -> str:
+        endpoint = "/ocr/pdf" if path.endswith(".pdf") else "/ocr/image"
+        with open(path, "rb") as f:
+            content = f.read()
+        if self.unique:
+            # Như load_test.py: thêm byte cuối file (PNG / PDF vẫn đọc được) để
+            # lượt làm nóng và các lượt lặp không trúng cache kết quả của server
+            content += f"\n%{time.time_ns()}\n".encode()
+        response = self.session.post(
+            self.url + endpoint, files={"file": (os.path.basename(path), content)}
+        )
+        response.raise_for_status()
+        return response.json()["text"]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả KB, macOS trả byte
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(runner, items: List[Dict], repeat: int) -> Dict:
+    latencies = []
+    errors = []
+    pages = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            doc_start = time.perf_counter()
+            text = runner.run(item["path"])
+            latencies.append(time.perf_counter() - doc_start)
+            pages += item["pages"]
+            errors.append(cer(item["truth"], _PAGE_HEADER.sub("", text)))
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": len(latencies),
+        "pages": pages,
+        "pages_per_s": pages / elapsed if elapsed else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "cer": sum(errors) / len(errors) if errors else 0.0,
+    }
+
+
+# ----------------- SO SÁNH BASELINE -----------------
+def compare_baseline(report: Dict, baseline: Dict, tolerance: float, cer_tolerance: float) -> List[str]:
+    """
+    Danh sách lỗi hồi quy: pages/sec giảm hoặc p95 tăng quá `tolerance`
+    (tỉ lệ), CER tăng quá `cer_tolerance` (tuyệt đối).
+    """
+    regressions = []
+    if baseline.get("result_cache", "bypassed") != report["result_cache"]:
+        regressions.append(
+            f"result_cache {report['result_cache']} ≠ baseline {baseline.get('result_cache')}"
+            " (không so được)"
+        )
+    for name, current in report["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if old is None:
+            continue
+        if current["pages_per_s"] < old["pages_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: pages/sec {current['pages_per_s']:.2f} < {old['pages_per_s']:.2f}"
+            )
+        if current["latency_p95_s"] > old["latency_p95_s"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {current['latency_p95_s']:.3f}s > {old['latency_p95_s']:.3f}s"
+            )
+        if current["cer"] > old["cer"] + cer_tolerance:
+            regressions.append(f"{name}: CER {current['cer']:.4f} > {old['cer']:.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline OCR trên dữ liệu tổng hợp")
+    parser.add_argument("--data", default="bench_data", help="Thư mục lưu dữ liệu sinh ra")
+    parser.add_argument("--docs", type=int, default=5, help="Số tài liệu mỗi nhóm")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lượt chạy lại mỗi nhóm")
+    parser.add_argument("--cases", help="Chỉ chạy các nhóm này (phân tách bằng dấu phẩy)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--font", help="Font TrueType có dấu tiếng Việt")
+    parser.add_argument("--url", help="Đo qua API HTTP (vd. http://localhost:8000) thay vì gọi engine")
+    parser.add_argument("--unique", action="store_true",
+                        help="Với --url: thay đổi nội dung mỗi request để không trúng cache của server")
+    parser.add_argument("--backend", choices=["native", "onnx"], default="native")
+    parser.add_argument("--rec-batch-size", type=int, default=16)
+    parser.add_argument("--cascade", action="store_true",
+                        help="Nhận dạng 2 tầng Paddle → VietOCR (so CER / tốc độ với mặc định)")
+    parser.add_argument("--out", help="Ghi báo cáo JSON ra file")
+    parser.add_argument("--baseline", help="Báo cáo JSON cũ để kiểm tra hồi quy")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Ngưỡng chậm đi cho phép so với baseline (tỉ lệ)")
+    parser.add_argument("--cer-tolerance", type=float, default=0.01,
+                        help="Mức tăng CER cho phép so với baseline (tuyệt đối)")
+    args = parser.parse_args()
+
+    font_path = find_font(args.font)
+    selected = set(args.cases.split(",")) if args.cases else None
+    cases = [case for case in CASES if selected is None or case[0] in selected]
+
+    corpus = {case[0]: generate_case(case, args.data, args.docs, font_path, args.seed)
+              for case in cases}
+
+    engine_options = {"backend": args.backend, "rec_batch_size": args.rec_batch_size,
+                      "cascade": args.cascade}
+    if args.url:
+        runner = HttpRunner(args.url, args.unique)
+    else:
+        load_start = time.perf_counter()
+        runner = EngineRunner(engine_options)
+        load_s = time.perf_counter() - load_start
+    # Làm nóng (cấp phát bộ nhớ, JIT) trước khi đo
+    runner.run(next(iter(corpus.values()))[0]["path"])
+    runner.timings.clear()
+
+    report = {
+        "mode": "http" if args.url else "engine",
+        "engine_options": None if args.url else engine_options,
+        "docs_per_case": args.docs,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        # Engine luôn chạy với use_cache=False; qua HTTP chỉ bỏ qua cache khi --unique
+        "result_cache": "on" if args.url and not args.unique else "bypassed",
+        "cases": {},
+    }
+    for name, items in corpus.items():
+        print(f"⏱️  {name} ({len(items)} docs)")
+        report["cases"][name] = run_case(runner, items, args.repeat)
+    if not args.url:
+        report["peak_rss_mb"] = peak_rss_mb()
+        report["model_load_s"] = load_s
+        report["stage_seconds"] = runner.timings
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(report, baseline, args.tolerance, args.cer_tolerance)
+        if regressions:
+            print("❌ Performance regression:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✅ No regression vs baseline")
+
+
+if __name__ == "__main__":
+    main()
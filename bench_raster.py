@@ -0,0 +1,91 @@
+"""
+Benchmark render trang PDF: đường cũ (render 2x → PNG encode → PNG decode →
+RGB → LANCZOS → numpy → xám) so với đường của OCREngine._render_page (gọi
+thẳng `ocr_engine.render_pdf_page`: render đúng kích thước, ảnh xám, numpy
+view trên pixmap).
+
+Không cần load model OCR. `peak_python_alloc_mb` đo bằng tracemalloc nên chỉ
+tính bộ nhớ cấp phát qua Python (bytes PNG, PIL, numpy), không tính bộ nhớ bên
+trong MuPDF.
+
+    python bench_raster.py document.pdf --pages 20
+"""
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from ocr_engine import render_pdf_page
+
+
+def render_legacy(page) -> np.ndarray:
+    """
+    Đường render trước đây (render RGB 2x → PNG → PIL → LANCZOS → xám), đã bị
+    xoá khỏi engine nên giữ lại ở đây làm mốc so sánh.
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
+    img = Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
+    max_side = 2000
+    w, h = img.size
+    scale = min(max_side / max(w, h), 1.0)
+    if scale < 1.0:
+        img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2GRAY)
+
+
+def render_direct(page) -> np.ndarray:
+    """Đường render của OCREngine._render_page(gray=True), không detect theo tile."""
+    arr, pix = render_pdf_page(page, gray=True)
+    # Bước tiền xử lý đầu tiên (CLAHE) tạo mảng mới nên đo luôn bản copy ở đây
+    return np.ascontiguousarray(arr[:, :, 0])
+
+
+def measure(render, doc, pages: int) -> dict:
+    times = []
+    peak = 0
+    for page_num in range(min(pages, len(doc))):
+        page = doc[page_num]
+        tracemalloc.start()
+        start = time.perf_counter()
+        render(page)
+        times.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "pages": len(times),
+        "mean_ms": 1000 * float(np.mean(times)),
+        "p95_ms": 1000 * float(np.percentile(times, 95)),
+        "peak_python_alloc_mb": peak / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark render trang PDF")
+    parser.add_argument("pdf", help="File PDF dùng để đo")
+    parser.add_argument("--pages", type=int, default=10, help="Số trang đo")
+    args = parser.parse_args()
+
+    doc = fitz.open(args.pdf)
+    try:
+        # Chạy một lượt làm nóng cache font / ảnh của MuPDF
+        render_legacy(doc[0])
+        render_direct(doc[0])
+        report = {
+            "legacy": measure(render_legacy, doc, args.pages),
+            "direct": measure(render_direct, doc, args.pages),
+        }
+    finally:
+        doc.close()
+
+    report["speedup"] = report["legacy"]["mean_ms"] / report["direct"]["mean_ms"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Hàm đo chất lượng OCR (CER) dùng chung cho các script so sánh / benchmark.
+"""
+
+
+def levenshtein(a: str, b: str) -> int:
+    """
+    Khoảng cách chỉnh sửa (số ký tự thêm / xoá / thay) giữa hai chuỗi.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def normalize_text(text: str) -> str:
+    """Gộp khoảng trắng để so sánh không phụ thuộc cách xuống dòng."""
+    return " ".join(text.split())
+
+
+def cer(reference: str, hypothesis: str) -> float:
+    """
+    Character error rate của `hypothesis` so với `reference` (0 = giống hệt).
+    """
+    reference = normalize_text(reference)
+    hypothesis = normalize_text(hypothesis)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    return levenshtein(reference, hypothesis) / len(reference)
+
+
+def percentile(values, q: float) -> float:
+    """
+    Phân vị thứ `q` (0-100) theo nội suy tuyến tính, giống numpy.percentile.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
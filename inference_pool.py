@@ -0,0 +1,351 @@
+"""
+Pool chạy OCR ngoài event loop của FastAPI, có giới hạn hàng đợi (admission control).
+
+Hai chế độ:
+- "thread": mỗi worker thread có một OCREngine riêng.
+- "process": model được load MỘT lần ở process cha, sau đó fork N worker
+  process dùng chung trọng số theo cơ chế copy-on-write.
+"""
+import asyncio
+import gc
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+# Engine dùng trong worker process (kế thừa từ process cha qua fork)
+_WORKER_ENGINE = None
+
+
+class PoolBusyError(Exception):
+    """Hàng đợi đã đầy, request bị từ chối."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"OCR pool đang quá tải, thử lại sau {retry_after}s")
+        self.retry_after = retry_after
+
+
+class StreamCancelled(Exception):
+    """Nơi nhận stream đã dừng (vd. client ngắt kết nối), bỏ phần còn lại."""
+
+
+class _LoopSink:
+    """Đẩy item từ worker thread vào asyncio.Queue của event loop."""
+
+    def __init__(self, loop, items: "asyncio.Queue"):
+        self.loop = loop
+        self.items = items
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.items.put_nowait, item)
+
+
+class _StreamCallback:
+    """
+    Callback `on_page` cho `InferencePool.stream`. Pickle được (với sink /
+    event là proxy của multiprocessing Manager) nên dùng được cả ở chế độ
+    process.
+    """
+
+    def __init__(self, sink, cancelled):
+        self.sink = sink
+        self.cancelled = cancelled
+
+    def __call__(self, record: Dict[str, Any]):
+        if self.cancelled.is_set():
+            raise StreamCancelled()
+        self.sink.put(record)
+
+
+def default_threads_per_worker(workers: int) -> int:
+    """
+    Chia đều số core cho các worker để tránh oversubscription.
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _pin_threads(threads: int):
+    """
+    Giới hạn số thread intra-op của torch / OpenCV trong worker hiện tại.
+    (Số thread của Paddle được cố định lúc tạo engine qua `cpu_threads`.)
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception as e:
+        print(f"⚠️ Không thể set số thread torch: {e}")
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except Exception as e:
+        print(f"⚠️ Không thể set số thread OpenCV: {e}")
+
+
+def _init_process_worker(threads: int, warmup: bool, ready):
+    """
+    Khởi tạo worker process; báo (pid, lỗi hoặc None) vào `ready` khi xong để
+    process cha biết chắc từng worker đã warm-up.
+    """
+    try:
+        _pin_threads(threads)
+        if warmup:
+            # Warm-up chạy trong worker sau fork, không chạy ở process cha
+            _WORKER_ENGINE.warmup()
+    except Exception as e:
+        ready.put((os.getpid(), str(e)))
+        raise
+    ready.put((os.getpid(), None))
+    print(f"👷 OCR worker process {os.getpid()} ready ({threads} threads)")
+
+
+def _call_engine(method: str, args: tuple, kwargs: dict) -> Any:
+    return getattr(_WORKER_ENGINE, method)(*args, **kwargs)
+
+
+class InferencePool:
+    def __init__(
+        self,
+        engine_factory: Callable[[], Any],
+        workers: int = 1,
+        max_queue: int = 8,
+        retry_after: int = 5,
+        mode: str = "thread",
+        threads_per_worker: Optional[int] = None,
+        warmup: bool = False,
+    ):
+        """
+        engine_factory: hàm tạo OCREngine.
+            - mode="thread": gọi một lần trong mỗi worker thread (model Paddle
+              không thread-safe), bộ nhớ model nhân theo `workers`.
+            - mode="process": gọi một lần ở process cha trước khi fork.
+        workers: số request OCR chạy song song.
+        max_queue: số request được phép chờ khi mọi worker đều bận. Vượt quá
+            thì `submit` ném PoolBusyError.
+        retry_after: số giây gợi ý client chờ trước khi gửi lại.
+        threads_per_worker: số thread intra-op của mỗi worker; mặc định chia
+            đều số core cho các worker.
+        warmup: gọi `engine.warmup()` trong từng worker trước khi `start()`
+            trả về, để request đầu tiên không chậm hơn các request sau.
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Chế độ pool không hợp lệ: {mode}")
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self.retry_after = retry_after
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(
+            self.workers
+        )
+        self._engine_factory = engine_factory
+        self.warmup = warmup
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+        self._ready = None
+
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    # ----------------- WORKER -----------------
+    def _init_thread_worker(self):
+        _pin_threads(self.threads_per_worker)
+        self._local.engine = self._engine_factory()
+        if self.warmup:
+            self._local.engine.warmup()
+
+    def _call_thread_engine(self, method: str, args: tuple, kwargs: dict) -> Any:
+        return getattr(self._local.engine, method)(*args, **kwargs)
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    # ----------------- API -----------------
+    def start(self):
+        """
+        Tạo worker và load model, chờ đến khi mọi worker sẵn sàng.
+        """
+        self.launch()
+        self.wait_ready()
+
+    def launch(self):
+        """
+        Tạo worker nhưng không chờ warm-up (xem `wait_ready`).
+        Ở chế độ process, model được load ở process cha và các worker được
+        fork ngay trong hàm này, nên phải gọi từ main thread trước khi tạo
+        thread nào khác: lock mà thread khác đang giữ lúc fork sẽ bị kẹt vĩnh
+        viễn trong process con.
+        """
+        global _WORKER_ENGINE
+        if self.mode == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="ocr-worker",
+                initializer=self._init_thread_worker,
+            )
+            # Barrier buộc executor tạo đủ `workers` thread; mỗi thread chỉ
+            # tới barrier sau khi initializer (load model, warm-up) xong
+            barrier = threading.Barrier(self.workers)
+            self._ready = [
+                self._executor.submit(barrier.wait) for _ in range(self.workers)
+            ]
+            return
+        # Manager (hàng đợi stream giữa worker và process cha) được fork
+        # trước khi load model để process của nó nhỏ
+        self._manager = multiprocessing.get_context("fork").Manager()
+        # Load model ở process cha; không chạy inference ở đây trước khi
+        # fork (thread pool OpenMP không an toàn qua fork)
+        _WORKER_ENGINE = self._engine_factory()
+        # Đưa mọi object hiện có ra khỏi GC để GC của worker không ghi
+        # vào các trang nhớ dùng chung (phá copy-on-write)
+        gc.freeze()
+        ready = self._manager.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_process_worker,
+            initargs=(self.threads_per_worker, self.warmup, ready),
+        )
+        # Với fork, executor fork đủ `workers` process ngay trong lần submit
+        # đầu tiên; future này chỉ dùng để phát hiện pool hỏng khi chờ
+        self._ready = (ready, self._executor.submit(os.getpid))
+
+    def wait_ready(self):
+        """
+        Chờ đến khi mọi worker đã load model và warm-up xong. Gọi được từ
+        thread khác (không fork gì ở đây).
+        """
+        if self.mode == "thread":
+            for future in self._ready:
+                future.result()
+            return
+        # Future của một việc chỉ cho biết worker chạy nó đã sẵn sàng, nên mỗi
+        # worker tự báo qua hàng đợi sau khi initializer chạy xong
+        ready, probe = self._ready
+        pending = self.workers
+        while pending:
+            try:
+                pid, error = ready.get(timeout=1)
+            except queue.Empty:
+                if probe.done() and probe.exception() is not None:
+                    raise probe.exception()  # BrokenProcessPool: worker chết khi khởi động
+                continue
+            if error is not None:
+                raise RuntimeError(f"OCR worker {pid} lỗi khi khởi động: {error}")
+            pending -= 1
+
+    def _submit(self, method: str, args: tuple, kwargs: dict, admit: bool) -> Future:
+        with self._lock:
+            if admit and self._pending >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise PoolBusyError(self.retry_after)
+            self._pending += 1
+        try:
+            if self.mode == "thread":
+                future = self._executor.submit(
+                    self._call_thread_engine, method, args, kwargs
+                )
+            else:
+                future = self._executor.submit(_call_engine, method, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """
+        Gọi `engine.<method>(*args, **kwargs)` trên một worker.
+        Ném PoolBusyError nếu hàng đợi đã đầy.
+        """
+        return self._submit(method, args, kwargs, admit=True)
+
+    def submit_unbounded(self, method: str, *args, **kwargs) -> Future:
+        """
+        Như `submit` nhưng không bị giới hạn hàng đợi (cho consumer nội bộ
+        vốn đã tự giới hạn số việc gửi vào).
+        """
+        return self._submit(method, args, kwargs, admit=False)
+
+    async def run(self, method: str, *args, **kwargs) -> Any:
+        """
+        Bản async của `submit`: chờ kết quả mà không chặn event loop.
+        """
+        return await asyncio.wrap_future(self.submit(method, *args, **kwargs))
+
+    def stream(self, method: str, *args, **kwargs) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Như `run` nhưng cho kết quả từng phần: gọi `engine.<method>` với
+        `on_page` và trả về async iterator gồm ("page", record) ngay khi mỗi
+        trang xong, cuối cùng là ("result", kết quả đầy đủ).
+        Việc được gửi vào pool ngay lúc gọi (ném PoolBusyError nếu hàng đợi
+        đầy). Đóng iterator giữa chừng sẽ dừng OCR ở trang kế tiếp.
+        Phải gọi trong event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            items = asyncio.Queue()
+            sink = _LoopSink(loop, items)
+            cancelled = threading.Event()
+            get = items.get
+        else:
+            sink = self._manager.Queue()
+            cancelled = self._manager.Event()
+
+            def get():
+                return loop.run_in_executor(None, sink.get)
+
+        future = self.submit(
+            method, *args, on_page=_StreamCallback(sink, cancelled), **kwargs
+        )
+        # Mọi record được đẩy trước khi future xong → None luôn đến cuối cùng
+        future.add_done_callback(lambda _: sink.put(None))
+        return self._drain(future, get, cancelled)
+
+    async def _drain(self, future: Future, get, cancelled) -> AsyncIterator[Tuple[str, Any]]:
+        try:
+            while True:
+                record = await get()
+                if record is None:
+                    break
+                yield "page", record
+            yield "result", await asyncio.wrap_future(future)
+        finally:
+            cancelled.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "threads_per_worker": self.threads_per_worker,
+                "max_queue": self.max_queue,
+                "queued": max(0, pending - self.workers),
+                "in_flight": min(pending, self.workers),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def is_busy(self) -> bool:
+        with self._lock:
+            return self._pending >= self.workers + self.max_queue
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
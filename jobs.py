@@ -0,0 +1,368 @@
+"""
+Job OCR bất đồng bộ cho tài liệu lớn.
+
+- JobStore: hàng đợi bền vững bằng SQLite + thư mục chứa file upload, sống
+  qua restart. Job đang chạy được giữ bằng lease do process chạy nó gia hạn
+  định kỳ; job hết lease (process chết / restart) được đưa lại về hàng đợi.
+  Nhiều process (vd. nhiều worker uvicorn) dùng chung một DB vẫn an toàn.
+- JobRunner: N consumer thread lấy job từ hàng đợi, chạy OCR qua InferencePool
+  và ghi tiến độ theo từng trang.
+"""
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+# Trạng thái job
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLING = "cancelling"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Job bị huỷ trong lúc đang chạy."""
+
+
+class JobStore:
+    def __init__(self, root_dir: str, lease_seconds: float = 60.0):
+        """
+        root_dir: thư mục chứa `jobs.sqlite3` và các file upload (`inputs/`).
+        lease_seconds: thời hạn giữ job đang chạy; process chạy job phải gia
+            hạn (`renew_leases`) trước khi hết hạn, nếu không job bị coi là
+            chạy dở và được đưa lại về hàng đợi.
+        """
+        self.root_dir = root_dir
+        self.inputs_dir = os.path.join(root_dir, "inputs")
+        self.db_path = os.path.join(root_dir, "jobs.sqlite3")
+        self.lease_seconds = lease_seconds
+        # Định danh process này trong cột owner của job nó đang chạy
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.inputs_dir, exist_ok=True)
+
+        with self._db() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    input_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    pages_total INTEGER,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    lease_until REAL
+                )
+                """
+            )
+            # DB tạo trước khi có lease
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Mỗi thao tác một connection: an toàn giữa các thread và process
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _db(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ----------------- GHI -----------------
+    def submit(self, filename: str, content: Union[bytes, BinaryIO]) -> str:
+        """`content`: bytes hoặc file-like object (được copy theo từng khối)."""
+        job_id = uuid.uuid4().hex
+        ext = os.path.splitext(filename)[1].lower()
+        input_path = os.path.join(self.inputs_dir, f"{job_id}{ext}")
+        with open(input_path, "wb") as f:
+            if hasattr(content, "read"):
+                shutil.copyfileobj(content, f, 1024 * 1024)
+            else:
+                f.write(content)
+        with self._db() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, filename, input_path, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, filename, input_path, QUEUED, time.time()),
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Lấy job cũ nhất đang chờ và chuyển sang RUNNING (nguyên tử), giữ lease
+        cho process này.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, owner = ?, lease_until = ? "
+                "WHERE id = ?",
+                (RUNNING, now, self.owner, now + self.lease_seconds, row["id"]),
+            )
+            conn.execute("COMMIT")
+            return dict(row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id: str, pages_done: int, pages_total: int) -> str:
+        """Ghi tiến độ, trả về trạng thái hiện tại của job."""
+        with self._db() as conn:
+            conn.execute(
+                "UPDATE jobs SET pages_done = ?, pages_total = ? WHERE id = ?",
+                (pages_done, pages_total, job_id),
+            )
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else CANCELLED
+
+    def _finish(self, job_id: str, status: str, result=None, error: Optional[str] = None):
+        with self._db() as conn:
+            row = conn.execute(
+                "SELECT input_path FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            # Chỉ process còn giữ job mới được ghi kết quả: job đã mất lease có
+            # thể đang được process khác chạy lại
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, "
+                "owner = NULL, lease_until = NULL WHERE id = ? AND owner = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                    self.owner,
+                ),
+            )
+        if cur.rowcount and row and os.path.exists(row["input_path"]):
+            os.unlink(row["input_path"])
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        self._finish(job_id, DONE, result=result)
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, FAILED, error=error)
+
+    def mark_cancelled(self, job_id: str):
+        self._finish(job_id, CANCELLED)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Huỷ job: job đang chờ bị huỷ ngay, job đang chạy dừng ở trang kế tiếp.
+        Trả về trạng thái mới, None nếu không có job.
+        """
+        with self._db() as conn:
+            row = conn.execute(
+                "SELECT status, input_path FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            # Điều kiện trên status để không tranh chấp với consumer đang claim
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+            if cur.rowcount:
+                if os.path.exists(row["input_path"]):
+                    os.unlink(row["input_path"])
+                return CANCELLED
+            cur = conn.execute(
+                "UPDATE jobs SET status = ? WHERE id = ? AND status = ?",
+                (CANCELLING, job_id, RUNNING),
+            )
+            if cur.rowcount:
+                return CANCELLING
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return row["status"]
+
+    def renew_leases(self) -> int:
+        """Gia hạn lease của các job process này đang chạy."""
+        with self._db() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time() + self.lease_seconds, self.owner, RUNNING, CANCELLING),
+            )
+            return cur.rowcount
+
+    def requeue_interrupted(self) -> int:
+        """
+        Đưa job chạy dở đã hết lease (process chạy nó bị tắt) về hàng đợi; job
+        đang huỷ dở thì coi như đã huỷ. Job của process khác còn sống (vẫn gia
+        hạn lease) không bị động tới.
+        """
+        now = time.time()
+        with self._db() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, owner = NULL, lease_until = NULL "
+                "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (CANCELLED, now, CANCELLING, now),
+            )
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, pages_done = 0, started_at = NULL, "
+                "owner = NULL, lease_until = NULL "
+                "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, RUNNING, now),
+            )
+            return cur.rowcount
+
+    # ----------------- ĐỌC -----------------
+    def get(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        with self._db() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for internal in ("input_path", "owner", "lease_until"):
+            job.pop(internal)
+        result = job.pop("result")
+        if with_result:
+            job["result"] = json.loads(result) if result else None
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        with self._db() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class JobProgress:
+    """
+    Callback `on_page` của OCREngine cho một job: ghi tiến độ vào SQLite và
+    ném JobCancelled nếu job đã bị huỷ. Pickle được nên dùng được cả khi
+    engine chạy trong worker process.
+    """
+
+    def __init__(self, root_dir: str, job_id: str):
+        self.root_dir = root_dir
+        self.job_id = job_id
+        self._store = None
+
+    def __getstate__(self):
+        return {"root_dir": self.root_dir, "job_id": self.job_id, "_store": None}
+
+    def __call__(self, record: Dict[str, Any]):
+        if self._store is None:
+            self._store = JobStore(self.root_dir)
+        status = self._store.update_progress(
+            self.job_id, record["page"], record["total"]
+        )
+        if status in (CANCELLING, CANCELLED):
+            raise JobCancelled(self.job_id)
+
+
+class JobRunner:
+    def __init__(self, store: JobStore, pool, consumers: int = 1, poll_interval: float = 1.0):
+        """
+        store: JobStore.
+        pool: InferencePool để chạy OCR (dùng chung worker với API đồng bộ).
+        consumers: số job chạy đồng thời.
+        Ngoài các consumer còn một thread gia hạn lease của job đang chạy và
+        đưa job hết lease (của process đã chết) về hàng đợi.
+        """
+        self.store = store
+        self.pool = pool
+        self.consumers = max(1, int(consumers))
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._requeue()
+        for i in range(self.consumers):
+            thread = threading.Thread(
+                target=self._consume, name=f"ocr-job-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="ocr-job-lease", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _requeue(self):
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            print(f"🔁 Requeued {requeued} interrupted job(s)")
+            self.notify()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.store.lease_seconds / 3):
+            try:
+                self.store.renew_leases()
+                self._requeue()
+            except Exception as e:
+                print(f"⚠️ Không gia hạn được lease job: {e}")
+
+    def notify(self):
+        """Báo có job mới để consumer không phải chờ hết chu kỳ poll."""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _consume(self):
+        while not self._stop.is_set():
+            job = self.store.claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        print(f"🧾 Job {job_id}: {job['filename']}")
+        try:
+            # Consumer đã tự giới hạn số job đồng thời nên không chịu admission
+            # control của API đồng bộ
+            future = self.pool.submit_unbounded(
+                "process_file_detailed",
+                job["input_path"],
+                on_page=JobProgress(self.store.root_dir, job_id),
+            )
+            result = future.result()
+        except JobCancelled:
+            self.store.mark_cancelled(job_id)
+            print(f"🛑 Job {job_id} cancelled")
+        except Exception as e:
+            self.store.fail(job_id, str(e))
+            print(f"❌ Job {job_id} failed: {e}")
+        else:
+            self.store.complete(job_id, result)
+            print(f"✅ Job {job_id} done")
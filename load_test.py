@@ -0,0 +1,247 @@
+"""
+Load test cho OCR API: gửi request theo tốc độ đến cố định (open-loop) với
+giới hạn số request đồng thời, trên bộ tài liệu trộn (ảnh + PDF), lần lượt ở
+nhiều mức tải để tìm điểm bão hoà của một node.
+
+Latency được tính từ thời điểm request LẼ RA được gửi theo lịch (không chỉ lúc
+thực sự gửi), nên thời gian chờ phía client khi quá tải cũng được tính vào.
+
+    # Server chạy sẵn: OCR_CACHE_MB=0 python app.py
+    python load_test.py --url http://localhost:8000 --corpus bench_data \\
+        --rates 0.5,1,2,4 --duration 60 --concurrency 16 --out load.json
+
+`--corpus` là thư mục chứa PDF / PNG / JPG (vd. dữ liệu do bench_pipeline.py sinh).
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+from evaluation import percentile
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+ENDPOINTS = {
+    "image": "/ocr/image",
+    "pdf": "/ocr/pdf",
+    "auto": "/ocr/auto",
+}
+
+
+def load_corpus(root: str) -> List[Dict]:
+    corpus = []
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            ext = os.path.splitext(name)[1].lower()
+            if ext == ".pdf" or ext in IMAGE_EXTENSIONS:
+                path = os.path.join(dirpath, name)
+                with open(path, "rb") as f:
+                    corpus.append({"name": name, "kind": "pdf" if ext == ".pdf" else "image",
+                                   "content": f.read()})
+    if not corpus:
+        raise ValueError(f"Không có file PDF/PNG/JPG trong {root}")
+    return corpus
+
+
+def pick_request(rng: random.Random, corpus: List[Dict], endpoints: List[str]):
+    """Chọn ngẫu nhiên một file và một endpoint nhận được loại file đó."""
+    item = rng.choice(corpus)
+    choices = [e for e in endpoints if e in (item["kind"], "auto")]
+    if not choices:
+        return None
+    return item, ENDPOINTS[rng.choice(choices)]
+
+
+class LoadRun:
+    def __init__(self, url: str, corpus: List[Dict], endpoints: List[str],
+                 concurrency: int, timeout: float, unique: bool, seed: int):
+        self.url = url.rstrip("/")
+        self.corpus = [c for c in corpus if any(e in (c["kind"], "auto") for e in endpoints)]
+        if not self.corpus:
+            raise ValueError("Không có file phù hợp với các endpoint đã chọn")
+        self.endpoints = endpoints
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.unique = unique
+        self.rng = random.Random(seed)
+        self._local = threading.local()
+
+    def _session(self):
+        # requests.Session không thread-safe → mỗi thread một session
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _send(self, item: Dict, endpoint: str, scheduled: float, results: list, lock):
+        content = item["content"]
+        if self.unique:
+            # Thêm byte rác cuối file (PNG / JPG / PDF vẫn đọc được) để không
+            # trúng cache kết quả của server
+            content += f"\n%{time.time_ns()}-{threading.get_ident()}\n".encode()
+        status = "error"
+        try:
+            response = self._session().post(
+                self.url + endpoint,
+                files={"file": (item["name"], content)},
+                timeout=self.timeout,
+            )
+            status = str(response.status_code)
+        except requests.Timeout:
+            status = "timeout"
+        except Exception:
+            status = "error"
+        finished = time.perf_counter()
+        with lock:
+            results.append({
+                "endpoint": endpoint,
+                "status": status,
+                "latency": finished - scheduled,
+                "finished": finished,
+            })
+
+    def run(self, rate: float, duration: float) -> Dict:
+        """
+        Gửi request theo quá trình Poisson với tốc độ `rate` req/s trong
+        `duration` giây, rồi chờ các request đang chạy xong.
+        """
+        results: list = []
+        lock = threading.Lock()
+        sent = 0
+        start = time.perf_counter()
+        next_at = start
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                next_at += self.rng.expovariate(rate)
+                if next_at - start > duration:
+                    break
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                picked = pick_request(self.rng, self.corpus, self.endpoints)
+                if picked is None:
+                    continue
+                item, endpoint = picked
+                executor.submit(self._send, item, endpoint, next_at, results, lock)
+                sent += 1
+        elapsed = time.perf_counter() - start
+        return summarize(rate, duration, sent, elapsed, results)
+
+
+def summarize(rate: float, duration: float, sent: int, elapsed: float, results: List[Dict]) -> Dict:
+    statuses = Counter(r["status"] for r in results)
+    ok = [r["latency"] for r in results if r["status"] == "200"]
+    total = len(results) or 1
+
+    per_endpoint = {}
+    for endpoint in sorted({r["endpoint"] for r in results}):
+        latencies = [r["latency"] for r in results if r["endpoint"] == endpoint and r["status"] == "200"]
+        per_endpoint[endpoint] = {
+            "requests": sum(1 for r in results if r["endpoint"] == endpoint),
+            "ok": len(latencies),
+            "latency_p50_s": percentile(latencies, 50),
+            "latency_p95_s": percentile(latencies, 95),
+        }
+
+    return {
+        "offered_rate": rate,
+        "duration_s": duration,
+        "sent": sent,
+        "completed": len(results),
+        "throughput_ok_per_s": len(ok) / elapsed if elapsed else 0.0,
+        "status_counts": dict(statuses),
+        "error_rate": 1 - len(ok) / total,
+        "rate_503": statuses.get("503", 0) / total,
+        "rate_429": statuses.get("429", 0) / total,
+        "latency_p50_s": percentile(ok, 50),
+        "latency_p90_s": percentile(ok, 90),
+        "latency_p95_s": percentile(ok, 95),
+        "latency_p99_s": percentile(ok, 99),
+        "latency_max_s": max(ok) if ok else 0.0,
+        "endpoints": per_endpoint,
+    }
+
+
+def saturation_point(steps: List[Dict], max_error_rate: float, min_efficiency: float):
+    """
+    Mức tải lớn nhất mà node còn theo kịp: tỉ lệ lỗi (gồm 503 / 429) dưới
+    `max_error_rate` và throughput đạt ít nhất `min_efficiency` tốc độ gửi.
+    """
+    best = None
+    for step in steps:
+        if (
+            step["error_rate"] <= max_error_rate
+            and step["throughput_ok_per_s"] >= min_efficiency * step["offered_rate"]
+        ):
+            best = step["offered_rate"]
+        else:
+            break
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test cho OCR API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--corpus", default="bench_data", help="Thư mục PDF / PNG / JPG")
+    parser.add_argument("--endpoints", default="image,pdf,auto",
+                        help="Các endpoint dùng (image, pdf, auto), phân tách bằng dấu phẩy")
+    parser.add_argument("--rates", default="0.5,1,2,4",
+                        help="Các mức tải (request/giây) chạy lần lượt")
+    parser.add_argument("--duration", type=float, default=60, help="Thời gian mỗi mức tải (giây)")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Số request đồng thời tối đa phía client")
+    parser.add_argument("--timeout", type=float, default=300, help="Timeout mỗi request (giây)")
+    parser.add_argument("--cooldown", type=float, default=5, help="Nghỉ giữa các mức tải (giây)")
+    parser.add_argument("--unique", action="store_true",
+                        help="Thay đổi nội dung mỗi request để không trúng cache của server")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--min-efficiency", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Endpoint không hợp lệ: {', '.join(sorted(unknown))}")
+
+    corpus = load_corpus(args.corpus)
+    runner = LoadRun(args.url, corpus, endpoints, args.concurrency, args.timeout,
+                     args.unique, args.seed)
+
+    steps = []
+    rates = [float(r) for r in args.rates.split(",")]
+    for i, rate in enumerate(rates):
+        print(f"🚦 {rate} req/s × {args.duration}s ...")
+        step = runner.run(rate, args.duration)
+        steps.append(step)
+        print(
+            f"   ok {step['throughput_ok_per_s']:.2f} req/s, "
+            f"p50 {step['latency_p50_s']:.2f}s, p95 {step['latency_p95_s']:.2f}s, "
+            f"errors {step['error_rate']:.1%} (503 {step['rate_503']:.1%})"
+        )
+        if i < len(rates) - 1:
+            time.sleep(args.cooldown)
+
+    report = {
+        "url": args.url,
+        "corpus_files": len(corpus),
+        "endpoints": endpoints,
+        "concurrency": args.concurrency,
+        "unique": args.unique,
+        "steps": steps,
+        "saturation_rate": saturation_point(steps, args.max_error_rate, args.min_efficiency),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
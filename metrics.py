@@ -0,0 +1,249 @@
+"""
+Metric dạng Prometheus (text exposition format) cho endpoint /metrics.
+
+Tự cài đặt Counter / Histogram / Gauge tối giản, không cần thư viện
+prometheus_client. Các metric được cập nhật ở process của API (process cha):
+số liệu đo trong worker được trả về cùng kết quả (xem OCREngine.measure).
+"""
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Bucket mặc định (giây) cho thời gian request / từng bước
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: cần đúng các label {self.labelnames}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, value: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label → (số đếm theo bucket (không cộng dồn), tổng, số mẫu)
+        self._values: Dict[tuple, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, n + 1)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), t, n)) for k, (c, t, n) in self._values.items())
+        lines = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(key + (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {n}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge đọc giá trị lúc render (vd. độ sâu hàng đợi của pool)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str,
+                 read: Callable[[], Optional[Dict[tuple, float]]], labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._read = read
+
+    def _samples(self) -> List[str]:
+        values = self._read() or {}
+        return [
+            f"{self.name}{_format_labels(tuple(zip(self.labelnames, key)))} {_format_value(v)}"
+            for key, v in sorted(values.items())
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = TIME_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str,
+              read: Callable[[], Optional[Dict[tuple, float]]],
+              labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, read, labelnames))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+# ----------------- METRIC CỦA OCR API -----------------
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "ocr_requests_total", "Số request OCR theo endpoint và kết quả", ("endpoint", "status")
+)
+REQUEST_SECONDS = registry.histogram(
+    "ocr_request_seconds", "Thời gian xử lý request OCR (gồm đọc upload và chờ hàng đợi)",
+    ("endpoint",)
+)
+UPLOAD_READ_SECONDS = registry.histogram(
+    "ocr_upload_read_seconds", "Thời gian đọc file upload", ("endpoint",)
+)
+QUEUE_WAIT_SECONDS = registry.histogram(
+    "ocr_queue_wait_seconds", "Thời gian chờ trong hàng đợi trước khi worker nhận việc"
+)
+STAGE_SECONDS = registry.histogram(
+    "ocr_stage_seconds",
+    "Thời gian mỗi bước của pipeline trong một request "
+    "(render, load, blank_filter, preprocess, orientation, detect, crop, crop_cache, paddle_ocr, cls, recognize, postprocess, cache)",
+    ("stage",),
+)
+RECOGNIZE_PER_CROP = registry.histogram(
+    "ocr_recognize_seconds_per_crop",
+    "Thời gian nhận dạng VietOCR chia cho số dòng thực sự được nhận dạng trong request "
+    "(dòng chạy theo batch; không tính dòng lấy từ cache crop)",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+PAGES = registry.counter(
+    "ocr_pages_total",
+    "Số trang đã xử lý theo nguồn text (source=\"blank\": trang trắng bỏ qua OCR)",
+    ("source",),
+)
+LINES = registry.counter(
+    "ocr_lines_total",
+    "Số dòng theo tầng nhận dạng ở chế độ cascade (paddle: lấy luôn kết quả Paddle, vietocr)",
+    ("tier",),
+)
+PAGE_ROTATIONS = registry.counter(
+    "ocr_page_rotations_total",
+    "Số trang / vùng ảnh theo góc được xoay về (orientation=\"page\")",
+    ("degrees",),
+)
+CROP_CACHE = registry.counter(
+    "ocr_crop_cache_total",
+    "Số lần tra cache crop dòng theo kết quả (hit: lấy từ cache, duplicate: trùng crop "
+    "khác trong cùng lượt, miss: phải nhận dạng); hit rate = hit / tổng",
+    ("result",),
+)
+BOXES_PER_PAGE = registry.histogram(
+    "ocr_boxes_per_page", "Số dòng chữ detect được trên mỗi ảnh trang / vùng ảnh",
+    buckets=(0, 1, 5, 10, 20, 50, 100, 200, 500),
+)
+CROP_WIDTH = registry.histogram(
+    "ocr_crop_width_pixels", "Độ rộng crop dòng (pixel ảnh trang)",
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048),
+)
+CROP_HEIGHT = registry.histogram(
+    "ocr_crop_height_pixels", "Chiều cao crop dòng (pixel ảnh trang)",
+    buckets=(8, 16, 24, 32, 48, 64, 128, 256),
+)
+
+
+def observe_measurement(measurement: Dict) -> None:
+    """
+    Ghi số liệu do OCREngine.measure trả về vào các metric.
+    """
+    if measurement.get("queue_wait") is not None:
+        QUEUE_WAIT_SECONDS.observe(measurement["queue_wait"])
+    for stage, seconds in measurement.get("timings", {}).items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    samples = measurement.get("samples", {})
+    for value in samples.get("boxes_per_page", []):
+        BOXES_PER_PAGE.observe(value)
+    for value in samples.get("crop_width", []):
+        CROP_WIDTH.observe(value)
+    for value in samples.get("crop_height", []):
+        CROP_HEIGHT.observe(value)
+    for value in samples.get("page_rotation", []):
+        PAGE_ROTATIONS.inc(degrees=value)
+    for result, name in (
+        ("hit", "crop_cache_hits"),
+        ("duplicate", "crop_cache_duplicates"),
+        ("miss", "crop_cache_misses"),
+    ):
+        count = sum(samples.get(name, []))
+        if count:
+            CROP_CACHE.inc(count, result=result)
+    crops = sum(samples.get("recognized_crops", []))
+    if crops and "recognize" in measurement.get("timings", {}):
+        RECOGNIZE_PER_CROP.observe(measurement["timings"]["recognize"] / crops)
+
+
+def observe_pages(result: Dict) -> None:
+    for page in result.get("pages", []):
+        PAGES.inc(source=page.get("source", "ocr"))
+        for tier, count in page.get("tiers", {}).items():
+            LINES.inc(count, tier=tier)
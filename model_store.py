@@ -0,0 +1,92 @@
+"""
+Thư mục model cục bộ để OCREngine khởi động không cần mạng.
+
+Mặc định PaddleOCR tải model vào ~/.paddleocr, còn VietOCR tải file config
+(`Cfg.load_config_from_name`) và trọng số qua mạng mỗi lần khởi tạo. Chuẩn bị
+sẵn một lần (vd. lúc build Docker image) rồi trỏ OCR_MODEL_DIR vào đó:
+
+    python model_store.py --out models
+    OCR_MODEL_DIR=models python app.py
+
+Cấu trúc thư mục:
+    models/paddle/det, models/paddle/rec, models/paddle/cls   (model inference Paddle)
+    models/vietocr/config.yml, models/vietocr/vgg_transformer.pth
+"""
+import argparse
+import os
+import shutil
+from typing import Dict
+
+VIETOCR_CONFIG = "config.yml"
+VIETOCR_WEIGHTS = "vgg_transformer.pth"
+
+
+def paddle_dirs(model_dir: str) -> Dict[str, str]:
+    """Tham số thư mục model cho PaddleOCR(...)."""
+    return {
+        "det_model_dir": os.path.join(model_dir, "paddle", "det"),
+        "rec_model_dir": os.path.join(model_dir, "paddle", "rec"),
+        "cls_model_dir": os.path.join(model_dir, "paddle", "cls"),
+    }
+
+
+def load_vietocr_config(model_dir: str):
+    """
+    Config VietOCR từ thư mục cục bộ, trọng số trỏ vào file local và tắt tải
+    trọng số ImageNet của backbone (bị ghi đè bởi trọng số VietOCR).
+    """
+    from vietocr.tool.config import Cfg
+
+    config_path = os.path.join(model_dir, "vietocr", VIETOCR_CONFIG)
+    weights_path = os.path.join(model_dir, "vietocr", VIETOCR_WEIGHTS)
+    if not (os.path.exists(config_path) and os.path.exists(weights_path)):
+        raise FileNotFoundError(
+            f"Thiếu model VietOCR trong {model_dir}. "
+            f"Chạy: python model_store.py --out {model_dir}"
+        )
+    config = Cfg.load_config_from_file(config_path)
+    config["weights"] = weights_path
+    config["cnn"]["pretrained"] = False
+    return config
+
+
+def prepare(model_dir: str):
+    """
+    Tải model Paddle (det / rec / cls tiếng Việt) và VietOCR vgg_transformer
+    vào `model_dir`. Cần mạng; chỉ chạy một lần.
+    """
+    import yaml
+    from paddleocr import PaddleOCR
+    from vietocr.tool.config import Cfg
+    from vietocr.tool.utils import download_weights
+
+    # PaddleOCR tự tải model inference vào các thư mục này nếu chưa có
+    PaddleOCR(lang="vi", use_angle_cls=True, use_gpu=False, show_log=False,
+              **paddle_dirs(model_dir))
+    print(f"✅ Paddle models → {os.path.join(model_dir, 'paddle')}")
+
+    vietocr_dir = os.path.join(model_dir, "vietocr")
+    os.makedirs(vietocr_dir, exist_ok=True)
+    config = Cfg.load_config_from_name("vgg_transformer")
+    weights = config["weights"]
+    if weights.startswith("http"):
+        weights = download_weights(weights)
+    weights_path = os.path.join(vietocr_dir, VIETOCR_WEIGHTS)
+    shutil.copyfile(weights, weights_path)
+
+    config["weights"] = VIETOCR_WEIGHTS  # đường dẫn thật được gán lúc load
+    config["cnn"]["pretrained"] = False
+    with open(os.path.join(vietocr_dir, VIETOCR_CONFIG), "w", encoding="utf-8") as f:
+        yaml.safe_dump(dict(config), f, allow_unicode=True)
+    print(f"✅ VietOCR model → {vietocr_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tải model OCR vào thư mục cục bộ")
+    parser.add_argument("--out", default="models", help="Thư mục lưu model")
+    args = parser.parse_args()
+    prepare(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+OCR hàng loạt cả cây thư mục (backfill kho scan lưu trữ), không qua HTTP.
+
+- Duyệt thư mục, chia file cho N worker của InferencePool (mặc định chế độ
+  process: load model một lần rồi fork, các worker dùng chung trọng số).
+- Ghi kết quả ra một file JSONL (mỗi file một dòng) hoặc từng file .txt
+  giữ nguyên cấu trúc thư mục.
+- Manifest (JSONL, chỉ ghi nối) lưu file nào đã xong / lỗi: chạy lại cùng
+  lệnh thì tiếp tục từ chỗ dừng. Kết quả được ghi trước manifest nên khi bị
+  ngắt giữa chừng, file đang dở sẽ được OCR lại (JSONL có thể có dòng trùng,
+  lấy dòng cuối).
+- In throughput (file/s, trang/s) và ETA định kỳ.
+
+    python ocr_bulk.py /data/scans --out results.jsonl --workers 4
+    python ocr_bulk.py /data/scans --out texts/ --format text --workers 4
+    # Chia cho 3 máy, máy thứ nhất:
+    python ocr_bulk.py /data/scans --out part0.jsonl --shard 0/3
+"""
+import argparse
+import json
+import os
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from inference_pool import InferencePool, default_threads_per_worker
+from ocr_engine import OCREngine
+
+EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg")
+
+
+def iter_files(root: str, extensions: Tuple[str, ...]) -> Iterator[str]:
+    """Đường dẫn tương đối (theo `root`) của các file cần OCR, thứ tự ổn định."""
+    for dirpath, dirnames, files in os.walk(root):
+        dirnames.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in extensions:
+                yield os.path.relpath(os.path.join(dirpath, name), root)
+
+
+def in_shard(rel_path: str, shard: Optional[Tuple[int, int]]) -> bool:
+    """crc32 (không như hash() của Python) giống nhau giữa các máy và lần chạy."""
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(rel_path.encode("utf-8")) % count == index
+
+
+def parse_shard(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not value:
+        return None
+    index, count = (int(part) for part in value.split("/"))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard không hợp lệ: {value}")
+    return index, count
+
+
+def load_manifest(path: str) -> Dict[str, Dict]:
+    """Record cuối cùng của mỗi file trong manifest."""
+    records: Dict[str, Dict] = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # dòng cuối ghi dở khi bị ngắt
+            records[record["path"]] = record
+    return records
+
+
+def format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class ResultWriter:
+    """Ghi kết quả một file: một dòng JSONL hoặc một file .txt."""
+
+    def __init__(self, out: str, fmt: str):
+        self.out = out
+        self.fmt = fmt
+        self._jsonl = None
+        if fmt == "jsonl":
+            parent = os.path.dirname(os.path.abspath(out))
+            os.makedirs(parent, exist_ok=True)
+            self._jsonl = open(out, "a", encoding="utf-8")
+        else:
+            os.makedirs(out, exist_ok=True)
+
+    def write(self, rel_path: str, result: Dict):
+        if self._jsonl is not None:
+            record = {
+                "path": rel_path,
+                "text": result["text"],
+                "pages": [
+                    {"page": page["page"], "source": page["source"]}
+                    for page in result["pages"]
+                ],
+            }
+            self._jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._jsonl.flush()
+            return
+        path = os.path.join(self.out, rel_path + ".txt")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(result["text"])
+        os.replace(tmp_path, path)
+
+    def close(self):
+        if self._jsonl is not None:
+            self._jsonl.close()
+
+
+class Progress:
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.pages = 0
+        self.start = time.perf_counter()
+        self._last_report = self.start
+
+    def update(self, pages: int = 0, failed: bool = False):
+        self.done += 1
+        self.pages += pages
+        self.failed += int(failed)
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval or self.done == self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        files_per_s = self.done / elapsed
+        remaining = self.total - self.done
+        eta = format_eta(remaining / files_per_s) if files_per_s else "?"
+        percent = 100 * self.done / self.total if self.total else 100.0
+        print(
+            f"📈 {self.done}/{self.total} files ({percent:.1f}%) | "
+            f"{files_per_s:.2f} files/s, {self.pages / elapsed:.2f} pages/s | "
+            f"ETA {eta} | failed {self.failed}",
+            flush=True,
+        )
+
+
+def run(args) -> int:
+    manifest_path = args.manifest or (
+        args.out.rstrip(os.sep) + ".manifest.jsonl"
+        if args.format == "jsonl"
+        else os.path.join(args.out, "manifest.jsonl")
+    )
+    manifest = load_manifest(manifest_path)
+    skip = {
+        path for path, record in manifest.items()
+        if record["status"] == "done" or not args.retry_failed
+    }
+
+    extensions = tuple(e if e.startswith(".") else f".{e}" for e in args.extensions.split(","))
+    todo: List[str] = [
+        rel for rel in iter_files(args.input, extensions)
+        if rel not in skip and in_shard(rel, args.shard)
+    ]
+    print(f"📂 {len(todo)} file(s) to process, {len(skip)} already in manifest")
+    if not todo:
+        return 0
+
+    threads_per_worker = args.threads_per_worker or default_threads_per_worker(args.workers)
+    engine_options = {
+        "backend": args.backend,
+        # Số thread Paddle cố định lúc tạo engine (_pin_threads chỉ áp cho
+        # torch / OpenCV): chia đều số core cho các worker như app.py
+        "cpu_threads": threads_per_worker,
+        "rec_batch_size": args.rec_batch_size,
+        "model_dir": args.model_dir,
+        "cascade": args.cascade,
+        "orientation": args.orientation,
+        "crop_cache_size": args.crop_cache_size,
+    }
+    pool = InferencePool(
+        lambda: OCREngine(**engine_options),
+        workers=args.workers,
+        mode=args.mode,
+        threads_per_worker=threads_per_worker,
+    )
+    pool.start()
+
+    writer = ResultWriter(args.out, args.format)
+    progress = Progress(len(todo), args.progress_interval)
+    # Giới hạn số file đang chờ để bộ nhớ không tăng theo số file
+    max_inflight = args.workers * 2
+    inflight: Dict = {}
+    pending = iter(todo)
+    failed = 0
+    try:
+        with open(manifest_path, "a", encoding="utf-8") as manifest_file:
+            while True:
+                for rel in pending:
+                    future = pool.submit_unbounded(
+                        "process_file_detailed", os.path.join(args.input, rel)
+                    )
+                    inflight[future] = rel
+                    if len(inflight) >= max_inflight:
+                        break
+                if not inflight:
+                    break
+                finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    rel = inflight.pop(future)
+                    record = {"path": rel, "finished_at": time.time()}
+                    try:
+                        result = future.result()
+                        writer.write(rel, result)
+                        record.update(status="done", pages=len(result["pages"]))
+                    except Exception as e:
+                        record.update(status="failed", error=str(e))
+                        failed += 1
+                        print(f"❌ {rel}: {e}")
+                    manifest_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    manifest_file.flush()
+                    progress.update(record.get("pages", 0), record["status"] == "failed")
+    except KeyboardInterrupt:
+        print(f"\n🛑 Interrupted — run the same command again to resume ({manifest_path})")
+        return 130
+    finally:
+        writer.close()
+        pool.shutdown()
+
+    progress.report()
+    print(f"✅ Done: {progress.done - failed} ok, {failed} failed → {args.out}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR hàng loạt một cây thư mục")
+    parser.add_argument("input", help="Thư mục chứa PDF / PNG / JPG")
+    parser.add_argument("--out", required=True,
+                        help="File JSONL (--format jsonl) hoặc thư mục file .txt (--format text)")
+    parser.add_argument("--format", choices=["jsonl", "text"], default="jsonl")
+    parser.add_argument("--manifest",
+                        help="File manifest để tiếp tục khi chạy lại "
+                             "(mặc định <out>.manifest.jsonl hoặc <out>/manifest.jsonl)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Chạy lại cả các file đã lỗi trong manifest")
+    parser.add_argument("--extensions", default=",".join(EXTENSIONS))
+    parser.add_argument("--shard", type=parse_shard,
+                        help="Chỉ xử lý phần K/N của các file (chia cho nhiều máy), vd. 0/3")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument("--mode", choices=["process", "thread"], default="process")
+    parser.add_argument("--threads-per-worker", type=int)
+    parser.add_argument("--progress-interval", type=float, default=10,
+                        help="Chu kỳ in tiến độ (giây)")
+    parser.add_argument("--backend", choices=["native", "onnx"], default="native")
+    parser.add_argument("--model-dir", help="Thư mục model cục bộ (model_store.py)")
+    parser.add_argument("--rec-batch-size", type=int, default=16)
+    parser.add_argument("--cascade", action="store_true")
+    parser.add_argument("--orientation", choices=["page", "line", "off"], default="off")
+    parser.add_argument("--crop-cache-size", type=int, default=0)
+    args = parser.parse_args()
+    raise SystemExit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,18 @@
 import os
 import io
+import hashlib
+import inspect
+import json
+import queue
 import tempfile
-from typing import List
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from importlib import metadata
+from typing import (
+    Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+)
 
 # Tắt MKLDNN & GPU & OneDNN để tránh lỗi OneDNN
 # Phải set TRƯỚC khi import bất kỳ thứ gì từ Paddle
@@ -22,56 +33,545 @@ os.environ["FLAGS_jit_compile"] = "0"
 # Tắt các tính năng optimization khác
 os.environ["FLAGS_use_mkldnn_quantizer"] = "0"
 
-# Import paddle và set flags trước khi import PaddleOCR
-try:
-    import paddle
-    paddle.set_device('cpu')
-    # Tắt OneDNN trong Paddle
-    if hasattr(paddle, 'set_flags'):
-        paddle.set_flags({'FLAGS_use_mkldnn': False})
-    
-    # Monkey patch paddle.jit.save để tránh lỗi OneDNN khi export model
-    # (PaddleOCR có thể tự động cố gắng export model)
-    original_jit_save = None
-    if hasattr(paddle, 'jit') and hasattr(paddle.jit, 'save'):
-        original_jit_save = paddle.jit.save
-        def patched_jit_save(*args, **kwargs):
-            # Nếu có lỗi OneDNN, bỏ qua việc export
-            try:
-                return original_jit_save(*args, **kwargs)
-            except Exception as e:
-                if "OneDnnContext" in str(e) or "onednn" in str(e).lower():
-                    print(f"⚠️ Bỏ qua export model do lỗi OneDNN: {e}")
-                    return None
-                raise
-        paddle.jit.save = patched_jit_save
-except Exception as e:
-    print(f"⚠️ Không thể set flags Paddle: {e}")
-
-from paddleocr import PaddleOCR
-from vietocr.tool.config import Cfg
-from vietocr.tool.predictor import Predictor
 from PIL import Image
-import fitz  # PyMuPDF
-import cv2
 import numpy as np
 
+# Thư viện nặng (paddle, torch, vietocr, OpenCV, PyMuPDF) chỉ được import khi
+# tạo OCREngine đầu tiên (xem _import_backends): import module này rất nhanh,
+# app khởi động và trả lời /health/live ngay trong lúc model đang load.
+PaddleOCR = Cfg = Predictor = process_image = translate = None
+fitz = cv2 = torch = None
+_import_lock = threading.Lock()
+
+
+def _import_backends():
+    global PaddleOCR, Cfg, Predictor, process_image, translate, fitz, cv2, torch
+    with _import_lock:
+        if PaddleOCR is not None:
+            return
+
+        # Import paddle và set flags trước khi import PaddleOCR
+        try:
+            import paddle
+            paddle.set_device('cpu')
+            # Tắt OneDNN trong Paddle
+            if hasattr(paddle, 'set_flags'):
+                paddle.set_flags({'FLAGS_use_mkldnn': False})
+
+            # Monkey patch paddle.jit.save để tránh lỗi OneDNN khi export model
+            # (PaddleOCR có thể tự động cố gắng export model)
+            original_jit_save = None
+            if hasattr(paddle, 'jit') and hasattr(paddle.jit, 'save'):
+                original_jit_save = paddle.jit.save
+                def patched_jit_save(*args, **kwargs):
+                    # Nếu có lỗi OneDNN, bỏ qua việc export
+                    try:
+                        return original_jit_save(*args, **kwargs)
+                    except Exception as e:
+                        if "OneDnnContext" in str(e) or "onednn" in str(e).lower():
+                            print(f"⚠️ Bỏ qua export model do lỗi OneDNN: {e}")
+                            return None
+                        raise
+                paddle.jit.save = patched_jit_save
+        except Exception as e:
+            print(f"⚠️ Không thể set flags Paddle: {e}")
+
+        import cv2 as _cv2
+        import fitz as _fitz  # PyMuPDF
+        import torch as _torch
+        from vietocr.tool.config import Cfg as _Cfg
+        from vietocr.tool.predictor import Predictor as _Predictor
+        from vietocr.tool import translate as _translate
+        from paddleocr import PaddleOCR as _PaddleOCR
+
+        cv2, fitz, torch = _cv2, _fitz, _torch
+        Cfg, Predictor = _Cfg, _Predictor
+        process_image, translate = _translate.process_image, _translate.translate
+        PaddleOCR = _PaddleOCR
+
+from result_cache import CropCache, ResultCache, content_key
+
+# Đầu vào của engine: đường dẫn file, nội dung file (bytes) hoặc file-like
+# object (vd. UploadFile.file) — không cần ghi ra file tạm
+Source = Union[str, bytes, bytearray, BinaryIO]
+
+
+# ----------------- TIỆN ÍCH -----------------
+@contextmanager
+def _stage(timings: Optional[Dict[str, float]], name: str):
+    """
+    Cộng dồn thời gian (giây) của một bước xử lý vào `timings[name]`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _prefetch(items: Iterable, size: int) -> Iterator:
+    """
+    Lấy phần tử của `items` trong một thread nền, giữ tối đa `size` phần tử
+    chờ sẵn. Cho phép bước tạo (vd. render trang PDF) chạy chồng lên bước xử lý.
+    """
+    if size <= 0:
+        yield from items
+        return
+
+    buf: queue.Queue = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                buf.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in items:
+                if not put((True, item)):
+                    return
+            put((True, done))
+        except BaseException as e:
+            put((False, e))
+
+    thread = threading.Thread(target=producer, name="ocr-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            ok, item = buf.get()
+            if not ok:
+                raise item
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _as_input(source: Source) -> Source:
+    """
+    PathLike → str; bytes và file-like object (vd. file upload đã được
+    Starlette spool) giữ nguyên, không đọc cả file vào bộ nhớ.
+    """
+    if isinstance(source, os.PathLike):
+        return os.fspath(source)
+    return source
+
+
+def _is_stream(source: Source) -> bool:
+    return hasattr(source, "read")
+
+
+def _head(source: Source, size: int) -> bytes:
+    """`size` byte đầu của file-like object, không đổi vị trí đọc."""
+    if not _is_stream(source):
+        return bytes(source[:size])
+    source.seek(0)
+    head = source.read(size)
+    source.seek(0)
+    return head
+
+
+def _source_name(source: Source) -> str:
+    if isinstance(source, str):
+        return source
+    if _is_stream(source):
+        name = getattr(source, "name", None)
+        return name if isinstance(name, str) else "<stream>"
+    return f"<{len(source)} bytes>"
+
+
+def _is_pdf(source: Source) -> bool:
+    if isinstance(source, str):
+        return os.path.splitext(source)[1].lower() == ".pdf"
+    # Chữ ký PDF có thể đứng sau vài byte rác ở đầu file
+    return b"%PDF-" in _head(source, 1024)
+
+
+def _fd_path(stream: BinaryIO) -> Optional[str]:
+    """
+    Đường dẫn /proc/self/fd/N của file thật sau `stream` (Linux), kể cả file
+    tạm đã bị unlink; None nếu không có.
+    """
+    try:
+        fd = stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    path = f"/proc/self/fd/{fd}"
+    return path if os.path.exists(path) else None
+
+
+def render_pdf_page(page, clip=None, gray: bool = True, max_side: float = 2000):
+    """
+    Render trang PDF (hoặc vùng `clip`) thẳng ra numpy, không qua encode/decode
+    PNG. Zoom được chọn để cạnh dài nhất <= max_side ngay lúc render thay vì
+    render 2x rồi thu nhỏ. `gray=True` render ảnh xám vì tiền xử lý chỉ dùng
+    kênh xám. Chỉ cần PyMuPDF (không load model) nên bench_raster.py đo đúng
+    đường render của engine.
+    Trả về (mảng HxWxC, pixmap) — mảng là view trên bộ nhớ của pixmap nên
+    phải giữ pixmap sống cho đến khi dùng xong mảng.
+    """
+    import fitz  # PyMuPDF (đã có sẵn trong sys.modules khi engine đã load)
+
+    rect = clip if clip is not None else page.rect
+    # zoom 2.0 ~ 144 DPI, đủ nét; giới hạn cạnh dài để tránh quá to làm Paddle lỗi
+    zoom = min(2.0, max_side / max(rect.width, rect.height, 1))
+    pix = page.get_pixmap(
+        matrix=fitz.Matrix(zoom, zoom),
+        clip=clip,
+        colorspace=fitz.csGRAY if gray else fitz.csRGB,
+        alpha=False,
+    )
+    buf = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    arr = buf.reshape(pix.height, pix.stride)[:, : pix.width * pix.n]
+    return arr.reshape(pix.height, pix.width, pix.n), pix
+
+
+def _classify_density(
+    gray: np.ndarray,
+    blank_ink_ratio: float,
+    blank_faint_ratio: float,
+    sparse_ink_ratio: float,
+) -> str:
+    """
+    "blank" / "sparse" / "normal" của thumbnail xám một trang. Điểm mực là
+    điểm tối hơn nền giấy (phân vị 90) quá 40 mức xám; trang có tỉ lệ điểm
+    mực < blank_ink_ratio là trang trắng, trừ khi còn >= blank_faint_ratio
+    điểm hơi tối hơn nền (> 15 mức xám: chữ nhạt của bản photo mờ, bút chì)
+    — trường hợp khó phân định đó trả "sparse" để detector quyết định.
+    """
+    background = np.percentile(gray, 90)
+    ink_ratio = float(np.mean(gray < background - 40))
+    if ink_ratio < blank_ink_ratio:
+        faint_ratio = float(np.mean(gray < background - 15))
+        return "blank" if faint_ratio < blank_faint_ratio else "sparse"
+    if ink_ratio < sparse_ink_ratio:
+        return "sparse"
+    return "normal"
+
+
+# Đề xuất xoay 90° của projection profile: tỉ lệ điểm mực tối thiểu trên
+# thumbnail và độ chênh tối thiểu giữa profile cột và profile hàng
+_ROTATION_MIN_INK = 0.005
+_ROTATION_PROFILE_MARGIN = 3.0
+
+
+def _vertical_lines(boxes: list, min_lines: int = 3) -> bool:
+    """
+    Box của detector xác nhận trang xoay 90°: phần lớn các box thuôn dài
+    (cạnh dài >= 2 lần cạnh ngắn) là box đứng, và có ít nhất `min_lines` box
+    như vậy. Box gần vuông (từ ngắn, ký hiệu) không tính.
+    """
+    if not boxes:
+        return False
+    quads = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    widths = np.ptp(quads[:, :, 0], axis=1)
+    heights = np.ptp(quads[:, :, 1], axis=1)
+    tall = int(np.count_nonzero(heights >= 2 * widths))
+    wide = int(np.count_nonzero(widths >= 2 * heights))
+    return tall >= min_lines and tall > 2 * wide
+
+
+def _sorted_boxes(boxes: list) -> list:
+    """
+    Sắp xếp box theo thứ tự đọc (trên → dưới, trái → phải), giống hệt
+    `sorted_boxes` mà pipeline đầy đủ của PaddleOCR áp dụng trước khi recog.
+    """
+    return [boxes[i] for i in _reading_order(boxes)]
+
+
+def _reading_order(boxes: list) -> List[int]:
+    """Chỉ số của `boxes` theo thứ tự đọc (xem `_sorted_boxes`)."""
+    order = sorted(range(len(boxes)), key=lambda i: (boxes[i][0][1], boxes[i][0][0]))
+    for i in range(len(order) - 1):
+        for j in range(i, -1, -1):
+            a, b = boxes[order[j]], boxes[order[j + 1]]
+            if abs(b[0][1] - a[0][1]) < 10 and b[0][0] < a[0][0]:
+                order[j], order[j + 1] = order[j + 1], order[j]
+            else:
+                break
+    return order
+
+
+def _tile_starts(length: int, tile: int, overlap: int) -> List[int]:
+    """Toạ độ bắt đầu các tile dọc một cạnh; tile cuối sát mép ảnh."""
+    if length <= tile:
+        return [0]
+    step = max(1, tile - overlap)
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def _merge_tile_boxes(
+    boxes: list, tile_ids: List[int], tile_rects: List[Tuple[int, int, int, int]]
+) -> Tuple[list, List[List[int]]]:
+    """
+    Gộp box của các tile chồng lấn: hai box thuộc hai tile khác nhau, giao
+    nhau theo chiều ngang và cùng dòng (phần giao theo chiều dọc > 1/2 chiều
+    cao box thấp hơn) là cùng một dòng chữ bị detect hai lần hoặc bị cắt ở
+    đường nối → thay bằng hình chữ nhật bao của cả nhóm.
+    Hai box giao nhau thì giao nhau bên trong phần chung của hai tile, nên chỉ
+    so các box chạm dải chồng lấn của từng cặp tile kề nhau (tile_rects:
+    (x1, y1, x2, y2) theo toạ độ trang) thay vì ma trận N×N trên cả trang.
+    Trả về (box sau khi gộp, chỉ số các box gốc của từng box).
+    """
+    if not boxes:
+        return [], []
+    quads = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    x1, y1 = quads[:, :, 0].min(axis=1), quads[:, :, 1].min(axis=1)
+    x2, y2 = quads[:, :, 0].max(axis=1), quads[:, :, 1].max(axis=1)
+    heights = y2 - y1
+    ids = np.asarray(tile_ids)
+    members_of = [np.flatnonzero(ids == t) for t in range(len(tile_rects))]
+
+    parent = list(range(len(quads)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def touching(idx, ox1, oy1, ox2, oy2):
+        inside = (x2[idx] > ox1) & (x1[idx] < ox2) & (y2[idx] > oy1) & (y1[idx] < oy2)
+        return idx[inside]
+
+    for a, (ax1, ay1, ax2, ay2) in enumerate(tile_rects):
+        for b in range(a + 1, len(tile_rects)):
+            bx1, by1, bx2, by2 = tile_rects[b]
+            ox1, oy1 = max(ax1, bx1), max(ay1, by1)
+            ox2, oy2 = min(ax2, bx2), min(ay2, by2)
+            if ox1 >= ox2 or oy1 >= oy2:
+                continue  # hai tile không kề nhau
+            left = touching(members_of[a], ox1, oy1, ox2, oy2)
+            right = touching(members_of[b], ox1, oy1, ox2, oy2)
+            if not len(left) or not len(right):
+                continue
+            ix = np.minimum(x2[left, None], x2[right]) - np.maximum(x1[left, None], x1[right])
+            iy = np.minimum(y2[left, None], y2[right]) - np.maximum(y1[left, None], y1[right])
+            linked = (ix > 0) & (
+                iy > 0.5 * np.minimum(heights[left, None], heights[right])
+            )
+            for i, j in np.argwhere(linked):
+                parent[find(int(left[i]))] = find(int(right[j]))
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(quads)):
+        groups[find(i)].append(i)
+
+    merged = []
+    for members in groups.values():
+        if len(members) == 1:
+            merged.append(quads[members[0]].tolist())
+            continue
+        gx1, gy1 = float(x1[members].min()), float(y1[members].min())
+        gx2, gy2 = float(x2[members].max()), float(y2[members].max())
+        merged.append([[gx1, gy1], [gx2, gy1], [gx2, gy2], [gx1, gy2]])
+    return merged, list(groups.values())
+
 
 class OCREngine:
-    def __init__(self):
+    def __init__(
+        self,
+        rec_batch_size: int = 16,
+        rec_bucket_width: int = 0,
+        det_only: bool = False,
+        use_angle_cls: bool = True,
+        orientation: str = "off",
+        orientation_samples: int = 8,
+        cpu_threads: Optional[int] = None,
+        rec_page_window: int = 4,
+        pdf_prefetch: int = 2,
+        pdf_text_layer: bool = True,
+        text_layer_min_chars: int = 20,
+        ocr_coverage_threshold: float = 0.6,
+        ocr_min_region: float = 0.05,
+        blank_filter: bool = True,
+        blank_ink_ratio: float = 0.0003,
+        blank_faint_ratio: float = 0.02,
+        sparse_ink_ratio: float = 0.01,
+        det_tile_size: int = 0,
+        det_tile_overlap: int = 128,
+        det_tile_batch: int = 4,
+        cascade: bool = False,
+        cascade_min_score: float = 0.95,
+        cascade_max_letter_ratio: float = 0.5,
+        crop_cache_size: int = 0,
+        crop_cache_scope: str = "document",
+        crop_padding: int = 0,
+        min_box_size: int = 3,
+        rectify_min_angle: float = 3.0,
+        result_cache: Optional[ResultCache] = None,
+        backend: str = "native",
+        onnx_dir: str = "onnx_models",
+        rec_quantize: str = "none",
+        model_dir: Optional[str] = None,
+    ):
+        """
+        rec_batch_size: số dòng (crop) tối đa đưa vào VietOCR trong một lần
+            forward. <= 1 nghĩa là chạy tuần tự như cũ (predict từng crop).
+        rec_bucket_width: độ rộng mỗi bucket (pixel, sau khi chuẩn hoá chiều cao).
+            0 = gom đúng theo độ rộng → input giống hệt đường tuần tự, kết quả
+            không đổi. > 0 = pad trắng lên bội số của giá trị này để batch lớn
+            hơn (nhanh hơn nhưng kết quả có thể lệch nhẹ).
+        det_only: chỉ chạy detector của Paddle, bỏ recognizer của Paddle (kết
+            quả của nó vốn bị bỏ đi vì mọi crop đều nhận dạng lại bằng VietOCR).
+            Nhanh hơn nhưng kết quả khác mặc định: mọi box của detector đều
+            được nhận dạng (pipeline đầy đủ bỏ dòng Paddle rec có điểm <
+            drop_score 0.5, thường là box rác), chỉ box nhỏ hơn min_box_size
+            bị bỏ. False (mặc định) = pipeline đầy đủ det + cls + rec như cũ.
+        use_angle_cls: chạy angle classifier của Paddle (mặc định bật như
+            pipeline cũ). Ở chế độ det_only,
+            classifier chạy trên chính các crop gửi sang VietOCR và xoay 180°
+            những dòng bị ngược. Tương đương orientation="line".
+        orientation: xử lý trang / dòng bị xoay.
+            "page": mỗi trang kiểm tra hướng một lần — xoay 90° phát hiện bằng
+            projection profile trên ảnh thu nhỏ (dòng chữ ngang cho profile
+            theo hàng dao động mạnh hơn theo cột) rồi xác nhận bằng tỉ lệ
+            cạnh của box detector (box dòng chữ phải đứng), ngược 180° do angle
+            classifier bỏ phiếu trên orientation_samples dòng dài nhất. Trang
+            được xoay về đúng chiều trước khi crop; chi phí không tăng theo
+            số dòng. "line": classifier trên từng dòng (use_angle_cls).
+            "off": không xử lý.
+        cpu_threads: số thread CPU cho predictor Paddle (mặc định của Paddle
+            là 10). Nên đặt bằng số core chia cho số worker.
+        rec_page_window: số trang PDF gom crop lại để nhận dạng chung batch.
+            Bộ nhớ giữ crop tỉ lệ với giá trị này, không phụ thuộc số trang.
+        pdf_prefetch: số trang PDF render sẵn trong thread nền trong khi trang
+            hiện tại đang OCR (0 = render tuần tự).
+        pdf_text_layer: dùng text layer có sẵn của PDF cho các trang đủ text
+            (>= text_layer_min_chars ký tự) và ảnh phủ dưới
+            ocr_coverage_threshold diện tích trang; khi đó chỉ OCR các vùng ảnh
+            chiếm >= ocr_min_region diện tích trang. False = OCR mọi trang.
+        blank_filter: phân loại trang / vùng ảnh trên thumbnail trước khi
+            detect: tỉ lệ điểm mực < blank_ink_ratio là trang trắng (bỏ qua
+            toàn bộ pipeline, source="blank") trừ khi tỉ lệ nét mờ >=
+            blank_faint_ratio (khi đó vẫn detect như trang thưa; giá trị này
+            lớn hơn hẳn để hạt nhiễu scan, bóng mép giấy, chữ mặt sau in hằn
+            qua không làm mất trang trắng), < sparse_ink_ratio là trang thưa
+            ("density": "sparse"), còn lại "normal".
+        det_tile_size: > 0 = ảnh có cạnh dài hơn giá trị này được detect theo
+            từng tile vuông cạnh det_tile_size, chồng lấn det_tile_overlap
+            pixel; box được dời về toạ độ trang rồi gộp các box trùng / bị cắt
+            ở đường nối. Detector chỉ thấy ảnh <= det_limit_side_len (960) nên
+            nhờ vậy giữ được chữ nhỏ trên bản vẽ / scan A3; trang PDF khi đó
+            cũng không bị giới hạn cạnh dài 2000px lúc render. 0 = tắt.
+        det_tile_batch: số tile chạy chung một lần predictor (chế độ chỉ
+            detect); 1 = từng tile một.
+        cascade: nhận dạng 2 tầng. Paddle chạy đủ det + rec (giữ mọi box,
+            drop_score=0); dòng có độ tin cậy >= cascade_min_score, chỉ gồm ký
+            tự ASCII và tỉ lệ chữ cái <= cascade_max_letter_ratio (số, mã, ngày
+            tháng, số tiền) lấy luôn kết quả Paddle, các dòng còn lại (dễ có
+            dấu tiếng Việt mà model Paddle không nhận ra) mới qua VietOCR.
+            Mỗi trang có thêm "tiers": {"paddle": n, "vietocr": m}.
+        crop_cache_size: > 0 = cache text theo hash của crop dòng đã chuẩn hoá
+            (cao 32px như đầu vào VietOCR, giãn tương phản, lượng tử 8 mức
+            xám), LRU tối đa crop_cache_size dòng. Header / footer / nhãn biểu
+            mẫu lặp lại chỉ nhận dạng một lần. 0 = tắt.
+        crop_cache_scope: "document" = xoá cache khi bắt đầu mỗi tài liệu (mỗi
+            lượt batch), "shared" = dùng chung giữa các request của worker.
+        crop_padding: nới rộng crop dòng thêm số pixel này mỗi phía.
+        min_box_size: bỏ box có cạnh ngắn hơn giá trị này (pixel) — box rác
+            của detector, nhận dạng ra chữ vô nghĩa.
+        rectify_min_angle: box lệch quá số độ này so với phương ngang được
+            nắn phối cảnh về hình chữ nhật thay vì cắt theo hình chữ nhật bao
+            (vốn lẫn cả phần dòng trên / dưới). Giá trị >= 90 = luôn cắt thẳng.
+        result_cache: cache kết quả theo nội dung file và theo ảnh trang
+            (xem result_cache.py). None = không cache.
+        backend: "native" (Paddle Inference + PyTorch) hoặc "onnx" (VietOCR và
+            detector chạy bằng onnxruntime CPU, xem onnx_backend.py).
+        onnx_dir: thư mục chứa file .onnx; tự export nếu chưa có.
+        rec_quantize: recognizer INT8 — "none", "dynamic" hoặc "static" (chỉ
+            backend onnx, cần dữ liệu hiệu chuẩn). Xem quantization.py để đo
+            độ lệch CER / tốc độ so với fp32 trước khi bật.
+        model_dir: thư mục model cục bộ (tạo bằng `python model_store.py`):
+            load model Paddle + VietOCR từ đó, không tra cứu / tải qua mạng.
+            None = tải về thư mục mặc định của PaddleOCR / VietOCR như cũ.
+        """
+        if backend not in ("native", "onnx"):
+            raise ValueError(f"Backend không được hỗ trợ: {backend}")
+        if rec_quantize not in ("none", "dynamic", "static"):
+            raise ValueError(f"Chế độ lượng tử hoá không hợp lệ: {rec_quantize}")
+        if rec_quantize == "static" and backend != "onnx":
+            raise ValueError("rec_quantize='static' chỉ hỗ trợ backend='onnx'")
+        if crop_cache_scope not in ("document", "shared"):
+            raise ValueError(f"Phạm vi cache crop không hợp lệ: {crop_cache_scope}")
+        if orientation not in ("page", "line", "off"):
+            raise ValueError(f"Chế độ xoay trang không hợp lệ: {orientation}")
+        if det_tile_size > 0 and det_tile_overlap >= det_tile_size:
+            raise ValueError(
+                f"det_tile_overlap ({det_tile_overlap}) phải nhỏ hơn det_tile_size ({det_tile_size})"
+            )
+        options = {k: v for k, v in locals().items() if k != "self"}
+        _import_backends()
+        self.fingerprint = engine_fingerprint(**options)
+        self.result_cache = result_cache
+        self.rec_batch_size = max(1, int(rec_batch_size))
+        self.rec_bucket_width = max(0, int(rec_bucket_width))
+        self.det_only = det_only
+        if use_angle_cls and orientation == "off":
+            orientation = "line"
+        self.orientation = orientation
+        # Chế độ "page" vẫn cần load classifier nhưng không chạy trên từng dòng
+        self.use_angle_cls = orientation == "line"
+        self.page_cls = orientation == "page"
+        self.orientation_samples = max(1, int(orientation_samples))
+        self.rec_page_window = max(1, int(rec_page_window))
+        self.pdf_prefetch = max(0, int(pdf_prefetch))
+        self.pdf_text_layer = pdf_text_layer
+        self.text_layer_min_chars = text_layer_min_chars
+        self.ocr_coverage_threshold = ocr_coverage_threshold
+        self.ocr_min_region = ocr_min_region
+        self.blank_filter = blank_filter
+        self.blank_ink_ratio = blank_ink_ratio
+        self.blank_faint_ratio = blank_faint_ratio
+        self.sparse_ink_ratio = sparse_ink_ratio
+        self.det_tile_size = max(0, int(det_tile_size))
+        self.det_tile_overlap = max(0, int(det_tile_overlap))
+        self.det_tile_batch = max(1, int(det_tile_batch))
+        self.cascade = cascade
+        self.cascade_min_score = cascade_min_score
+        self.cascade_max_letter_ratio = cascade_max_letter_ratio
+        self.crop_cache = CropCache(crop_cache_size) if crop_cache_size > 0 else None
+        self.crop_cache_scope = crop_cache_scope
+        self.crop_padding = max(0, int(crop_padding))
+        self.min_box_size = max(1, int(min_box_size))
+        self.rectify_min_angle = rectify_min_angle
+        # Mẫu số liệu (số box, kích thước crop) của lần gọi `measure` hiện tại
+        self._samples: Optional[Dict[str, List[float]]] = None
+        paddle_options = {"cpu_threads": cpu_threads} if cpu_threads else {}
+        if cascade:
+            # Giữ cả dòng Paddle nhận dạng kém: chúng được chuyển sang VietOCR
+            paddle_options["drop_score"] = 0.0
+        if model_dir:
+            import model_store
+
+            paddle_options.update(model_store.paddle_dirs(model_dir))
+
         print("🔄 Loading PaddleOCR (detector + layout)...")
-        # Dùng PaddleOCR để detect vùng text (có luôn rec nhưng mình chỉ dùng detect)
+        # Dùng PaddleOCR để detect vùng text (model rec vẫn được load nhưng với
+        # det_only=True thì không bao giờ chạy)
         # Tắt hoàn toàn OneDNN/MKLDNN để tránh lỗi
         try:
             self.paddle = PaddleOCR(
                 lang="vi",
-                use_angle_cls=True,
+                use_angle_cls=orientation != "off",
                 use_gpu=False,
                 enable_mkldnn=False,  # rất quan trọng với CPU
                 use_pdserving=False,
                 use_tensorrt=False,
                 ir_optim=False,  # Tắt IR optimization có thể liên quan đến OneDNN
                 show_log=False,  # Tắt log để tránh một số vấn đề
+                **paddle_options,
             )
         except Exception as e:
             # Nếu vẫn lỗi, thử với các tham số tối thiểu
@@ -82,30 +582,98 @@ class OCREngine:
                 use_angle_cls=False,  # Tắt angle classifier
                 use_gpu=False,
                 enable_mkldnn=False,
+                **paddle_options,
             )
+            self.use_angle_cls = False
+            self.page_cls = False
 
         print("🔄 Loading VietOCR (recognizer)...")
-        config = Cfg.load_config_from_name("vgg_transformer")
+        if model_dir:
+            config = model_store.load_vietocr_config(model_dir)
+        else:
+            config = Cfg.load_config_from_name("vgg_transformer")
         config["device"] = "cpu"  # nếu có GPU thì đổi thành 'cuda'
         self.vietocr = Predictor(config)
 
+        self.onnx_recognizer = None
+        if backend == "onnx":
+            # Import muộn: onnxruntime chỉ cần khi dùng backend này
+            import onnx_backend
+
+            print("🔄 Loading ONNX Runtime backend...")
+            self.onnx_recognizer = onnx_backend.load_recognizer(
+                self.vietocr, onnx_dir, cpu_threads, quantize=rec_quantize
+            )
+            onnx_backend.attach_detector(self.paddle, onnx_dir, cpu_threads)
+        elif rec_quantize == "dynamic":
+            from quantization import quantize_torch_dynamic
+
+            print("🔄 Quantizing VietOCR (dynamic INT8)...")
+            self.vietocr.model = quantize_torch_dynamic(self.vietocr.model)
+
         print("✅ OCR Engine Ready")
 
+    def warmup(self):
+        """
+        Chạy thử detect + nhận dạng trên ảnh mẫu dựng sẵn để request thật đầu
+        tiên không phải trả chi phí cấp phát bộ nhớ / khởi tạo kernel.
+        """
+        start = time.perf_counter()
+        img = np.full((192, 960, 3), 255, dtype=np.uint8)
+        for i, text in enumerate(("OCR warm-up 0123456789", "Khoi dong mo hinh")):
+            cv2.putText(img, text, (24, 70 + i * 80), cv2.FONT_HERSHEY_SIMPLEX,
+                        1.5, (0, 0, 0), 3, cv2.LINE_AA)
+        self._ocr_pil_image(Image.fromarray(img))
+        print(f"🔥 Warm-up done in {time.perf_counter() - start:.2f}s")
+
     # ----------------- TIỀN XỬ LÝ ẢNH -----------------
-    def _preprocess_image(self, image: Image.Image) -> Image.Image:
+    def _to_gray(self, img_array: np.ndarray) -> np.ndarray:
+        # Chuyển sang grayscale (trang PDF render sẵn ở dạng xám thì bỏ qua)
+        if img_array.ndim == 3 and img_array.shape[2] == 1:
+            return img_array[:, :, 0]
+        if img_array.ndim == 2:
+            return img_array
+        if img_array.shape[2] == 4:
+            return cv2.cvtColor(img_array, cv2.COLOR_RGBA2GRAY)
+        return cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+
+    def _page_density(
+        self,
+        image: Union[Image.Image, np.ndarray],
+        timings: Optional[Dict[str, float]] = None,
+    ) -> str:
         """
-        Tiền xử lý hình ảnh để tối ưu cho OCR.
+        "blank" / "sparse" / "normal" (xem `_classify_density`) trên thumbnail
+        cạnh dài ~320px; thu nhỏ kiểu INTER_AREA làm mờ chấm bụi nhỏ của ảnh
+        scan.
         """
-        img_array = np.array(image.convert("RGB"))
+        with _stage(timings, "blank_filter"):
+            if isinstance(image, np.ndarray):
+                gray = self._to_gray(image)
+                h, w = gray.shape[:2]
+                scale = min(1.0, 320 / max(h, w, 1))
+                if scale < 1.0:
+                    gray = cv2.resize(
+                        gray,
+                        (max(1, int(w * scale)), max(1, int(h * scale))),
+                        interpolation=cv2.INTER_AREA,
+                    )
+            else:
+                factor = max(1, max(image.size) // 320)
+                gray = np.asarray(image.reduce(factor).convert("L"))
+            return _classify_density(
+                gray, self.blank_ink_ratio, self.blank_faint_ratio, self.sparse_ink_ratio
+            )
 
-        # Chuyển sang grayscale
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    def _preprocess_array(self, img_array: np.ndarray) -> np.ndarray:
+        """
+        Tiền xử lý ảnh numpy (RGB, RGBA hoặc xám) → ảnh xám đã tăng tương phản.
+        """
+        gray = self._to_gray(img_array)
 
         # Tăng độ tương phản với CLAHE
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-
-        return Image.fromarray(enhanced)
+        return clahe.apply(np.ascontiguousarray(gray))
 
     def _postprocess_text(self, text: str) -> str:
         """
@@ -114,104 +682,1010 @@ class OCREngine:
         text = " ".join(text.split())
         return text.strip()
 
-    # ----------------- CORE: OCR 1 PIL IMAGE -----------------
-    def _ocr_pil_image(self, pil_img: Image.Image) -> str:
+    # ----------------- DETECT: PIL IMAGE → LIST CROP -----------------
+    def _detect_crops(
+        self,
+        image: Union[Image.Image, np.ndarray],
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[Union[np.ndarray, str]]:
         """
-        Nhận một PIL Image, chạy Paddle detect + VietOCR recog.
+        Tiền xử lý + Paddle detect, trả về các crop dòng (mảng xám HxW, phần lớn
+        là view trên ảnh trang) theo thứ tự đọc.
+        `image` là PIL Image hoặc mảng numpy (trang PDF render thẳng ra numpy).
         """
         # Tiền xử lý
-        pil_img = self._preprocess_image(pil_img)
+        with _stage(timings, "preprocess"):
+            if isinstance(image, np.ndarray):
+                img_np = self._preprocess_array(image)
+            else:
+                img_np = self._preprocess_array(np.array(image.convert("RGB")))
 
-        # PaddleOCR nhận numpy / path đều được → dùng numpy cho đỡ phải lưu file tạm
-        img_np = np.array(pil_img)
-        result = self.paddle.ocr(img_np, cls=True)
+        quarter_turns = 0
+        detected = None
+        if self.orientation == "page":
+            with _stage(timings, "orientation"):
+                if self._quarter_turns(img_np):
+                    # Projection profile chỉ là gợi ý: xác nhận bằng hình dạng
+                    # box của detector trên trang chưa xoay; không xác nhận
+                    # được thì dùng luôn các box đó, không detect lại
+                    detected = self._detect_page(img_np)
+                    if _vertical_lines(detected[0]):
+                        quarter_turns = 1
+                        img_np = np.ascontiguousarray(np.rot90(img_np, quarter_turns))
+                        detected = None
 
-        lines = []
-        if result and result[0]:
-            for line in result[0]:
-                box = line[0]  # 4 điểm [x, y]
-                xs = [pt[0] for pt in box]
-                ys = [pt[1] for pt in box]
+        det_only = self.det_only and not self.cascade
+        with _stage(timings, "detect" if det_only else "paddle_ocr"):
+            boxes, recs = detected if detected is not None else self._detect_page(img_np)
+
+        rotation = 90 * quarter_turns
+        if self.page_cls and boxes:
+            with _stage(timings, "orientation"):
+                if self._upside_down(img_np, boxes):
+                    # Box của ảnh xoay 180° chỉ là ảnh đối xứng tâm của box cũ
+                    # → không cần detect lại
+                    img_np = np.ascontiguousarray(img_np[::-1, ::-1])
+                    height, width = img_np.shape[:2]
+                    # Điểm trái-trên mới là ảnh của điểm phải-dưới cũ (box Paddle
+                    # theo thứ tự trái-trên, phải-trên, phải-dưới, trái-dưới)
+                    boxes = _sorted_boxes([
+                        [[width - box[i][0], height - box[i][1]] for i in (2, 3, 0, 1)]
+                        for box in boxes
+                    ])
+                    # Text Paddle nhận dạng trên dòng bị ngược không dùng được
+                    recs = [None] * len(boxes)
+                    rotation = (rotation + 180) % 360
+        if self._samples is not None and self.orientation == "page":
+            self._samples["page_rotation"].append(rotation)
 
-                x1, x2 = int(min(xs)), int(max(xs))
-                y1, y2 = int(min(ys)), int(max(ys))
+        # Crop dòng (lấy từ ảnh đã xoay về đúng chiều), hoặc text Paddle đã
+        # nhận dạng đủ tin cậy (chế độ cascade)
+        with _stage(timings, "crop"):
+            quads, rects, keep, rotated = self._line_geometry(boxes, img_np.shape[:2])
+            crops: List[Union[np.ndarray, str]] = []
+            for i in np.flatnonzero(keep):
+                rec = recs[i]
+                if rec is not None and self._cascade_accept(*rec):
+                    crops.append(rec[0])
+                elif rotated[i]:
+                    crops.append(self._rectified_crop(img_np, quads[i]))
+                else:
+                    x1, y1, x2, y2 = rects[i]
+                    crops.append(img_np[y1:y2, x1:x2])  # view, không copy
 
-                crop = pil_img.crop((x1, y1, x2, y2))
+        images = [i for i, c in enumerate(crops) if not isinstance(c, str)]
+        if self._samples is not None:
+            self._samples["boxes_per_page"].append(len(crops))
+            self._samples["crop_width"].extend(crops[i].shape[1] for i in images)
+            self._samples["crop_height"].extend(crops[i].shape[0] for i in images)
 
-                text = self.vietocr.predict(crop)
-                text = self._postprocess_text(text)
-                if text:
-                    lines.append(text)
+        if self.det_only and self.use_angle_cls and images:
+            with _stage(timings, "cls"):
+                rotated = self._classify_crops([crops[i] for i in images])
+                for i, crop in zip(images, rotated):
+                    crops[i] = crop
+
+        return crops
+
+    def _line_geometry(self, boxes: list, shape: Tuple[int, ...]):
+        """
+        Xử lý mọi box của trang cùng lúc dưới dạng mảng (N, 4, 2): cắt theo
+        khung ảnh, hình chữ nhật bao (đã nới crop_padding), lọc box quá nhỏ /
+        suy biến và đánh dấu box bị xoay cần nắn phối cảnh.
+        Trả về (quads float32 (N,4,2), rects int (N,4) x1 y1 x2 y2,
+        keep bool (N,), rotated bool (N,)).
+        """
+        height, width = shape[:2]
+        quads = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+        quads[..., 0] = quads[..., 0].clip(0, width)
+        quads[..., 1] = quads[..., 1].clip(0, height)
+
+        pad = self.crop_padding
+        rects = np.concatenate(
+            [quads.min(axis=1).astype(np.int64) - pad, quads.max(axis=1).astype(np.int64) + pad],
+            axis=1,
+        )
+        rects[:, [0, 2]] = rects[:, [0, 2]].clip(0, width)
+        rects[:, [1, 3]] = rects[:, [1, 3]].clip(0, height)
+
+        # Kích thước theo cạnh của box (box xoay) và góc cạnh trên so với phương ngang
+        top = quads[:, 1] - quads[:, 0]
+        side = quads[:, 3] - quads[:, 0]
+        box_w = np.maximum(np.linalg.norm(top, axis=1), np.linalg.norm(quads[:, 2] - quads[:, 3], axis=1))
+        box_h = np.maximum(np.linalg.norm(side, axis=1), np.linalg.norm(quads[:, 2] - quads[:, 1], axis=1))
+        angles = np.degrees(np.abs(np.arctan2(top[:, 1], top[:, 0])))
+        rotated = (angles > self.rectify_min_angle) & (angles < 180 - self.rectify_min_angle)
+
+        rect_w = rects[:, 2] - rects[:, 0]
+        rect_h = rects[:, 3] - rects[:, 1]
+        keep = np.where(
+            rotated,
+            np.minimum(box_w, box_h) >= self.min_box_size,
+            np.minimum(rect_w, rect_h) >= self.min_box_size,
+        )
+        return quads, rects, keep, rotated
+
+    def _rectified_crop(self, img_np: np.ndarray, quad: np.ndarray) -> np.ndarray:
+        """
+        Nắn box 4 điểm bị xoay về hình chữ nhật (như get_rotate_crop_image của
+        PaddleOCR); dòng dựng đứng (cao >= 1.5 lần rộng) được xoay nằm ngang.
+        """
+        width = int(max(np.linalg.norm(quad[0] - quad[1]), np.linalg.norm(quad[3] - quad[2])))
+        height = int(max(np.linalg.norm(quad[0] - quad[3]), np.linalg.norm(quad[1] - quad[2])))
+        target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        matrix = cv2.getPerspectiveTransform(quad.astype(np.float32), target)
+        crop = cv2.warpPerspective(
+            img_np, matrix, (width, height),
+            borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC,
+        )
+        if height >= 1.5 * width:
+            crop = np.ascontiguousarray(np.rot90(crop))
+        return crop
+
+    def _detect_page(self, img_np: np.ndarray) -> Tuple[list, list]:
+        """Detect cả trang (theo tile nếu ảnh lớn), box theo thứ tự đọc."""
+        height, width = img_np.shape[:2]
+        tile = self.det_tile_size
+        if tile and max(height, width) > tile:
+            return self._detect_tiled(img_np)
+        boxes, recs = self._run_detector(img_np)
+        if self.det_only and not self.cascade:
+            boxes = _sorted_boxes(boxes)
+        return boxes, recs
+
+    def _quarter_turns(self, gray: np.ndarray) -> int:
+        """
+        1 nếu dòng chữ trên trang có vẻ chạy dọc (trang xoay 90° / 270°), 0
+        nếu ngang. Projection profile trên ảnh nhị phân thu nhỏ: dòng chữ
+        ngang làm tổng điểm mực theo hàng dao động mạnh (dòng chữ / khoảng
+        trắng xen kẽ) hơn theo cột. Bảng, khung viền, trang gần trắng làm
+        profile nhiễu nên chỉ đề xuất xoay khi đủ mực và chênh lệch lớn; kết
+        quả còn phải được `_vertical_lines` xác nhận. 90° và 270° khác nhau
+        180° nên để bước bỏ phiếu của classifier phân biệt.
+        """
+        height, width = gray.shape[:2]
+        scale = min(1.0, 800 / max(height, width, 1))
+        if scale < 1.0:
+            gray = cv2.resize(
+                gray,
+                (max(1, int(width * scale)), max(1, int(height * scale))),
+                interpolation=cv2.INTER_AREA,
+            )
+        _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        if ink.mean() < _ROTATION_MIN_INK:
+            return 0
+        rows = ink.mean(axis=1)
+        cols = ink.mean(axis=0)
+        # Hệ số biến thiên (bình phương) để không phụ thuộc mật độ mực
+        row_score = rows.var() / max(rows.mean() ** 2, 1e-12)
+        col_score = cols.var() / max(cols.mean() ** 2, 1e-12)
+        return 1 if col_score > _ROTATION_PROFILE_MARGIN * row_score else 0
+
+    def _upside_down(self, gray: np.ndarray, boxes: list) -> bool:
+        """
+        Angle classifier của Paddle trên các dòng dài nhất của trang, bỏ phiếu
+        theo độ tin cậy: True nếu trang bị ngược 180°.
+        """
+        _, rects, keep, _ = self._line_geometry(boxes, gray.shape[:2])
+        rects = rects[keep]
+        longest = np.argsort(rects[:, 0] - rects[:, 2], kind="stable")[: self.orientation_samples]
+        crops = [
+            cv2.cvtColor(np.ascontiguousarray(gray[y1:y2, x1:x2]), cv2.COLOR_GRAY2RGB)
+            for x1, y1, x2, y2 in rects[longest]
+        ]
+        if not crops:
+            return False
+        _, cls_res, _ = self.paddle.text_classifier(crops)
+        votes = defaultdict(float)
+        for label, score in cls_res:
+            votes["180" if "180" in label else "0"] += score
+        return votes["180"] > votes["0"]
+
+    def _run_detector(self, img_np: np.ndarray) -> Tuple[list, list]:
+        """
+        (box 4 điểm [x, y], (text, score) hoặc None) của Paddle trên một ảnh
+        xám; chỉ chế độ cascade giữ lại kết quả nhận dạng của Paddle.
+        """
+        if self.det_only and not self.cascade:
+            # Chỉ detector: kết quả là list box 4 điểm, chưa sắp xếp
+            result = self.paddle.ocr(img_np, det=True, rec=False, cls=False)
+            boxes = list(result[0]) if result and result[0] else []
+            return boxes, [None] * len(boxes)
+        # Pipeline đầy đủ det + cls + rec
+        result = self.paddle.ocr(img_np, cls=self.use_angle_cls)
+        lines = result[0] if result and result[0] else []
+        boxes = [line[0] for line in lines]
+        if not self.cascade:
+            return boxes, [None] * len(boxes)
+        return boxes, [tuple(line[1]) for line in lines]
+
+    def _cascade_accept(self, text: str, score: float) -> bool:
+        """Dòng Paddle đủ tin cậy để bỏ qua VietOCR."""
+        text = text.strip()
+        if not text or score < self.cascade_min_score or not text.isascii():
+            return False
+        chars = [c for c in text if not c.isspace()]
+        letters = sum(1 for c in chars if c.isalpha())
+        return letters <= self.cascade_max_letter_ratio * len(chars)
+
+    def _detect_tiled(self, img_np: np.ndarray) -> Tuple[list, list]:
+        """
+        Detect theo từng tile chồng lấn (view trên ảnh trang, không copy), dời
+        box về toạ độ trang, gộp box trùng ở vùng chồng lấn và sắp xếp lại.
+        Các tile của một trang cùng kích thước nên ở chế độ chỉ detect chúng
+        được xếp chồng thành batch det_tile_batch ảnh cho một lần chạy
+        predictor; chế độ cascade / pipeline đầy đủ cần rec của Paddle cho
+        từng tile nên vẫn chạy lần lượt.
+        """
+        height, width = img_np.shape[:2]
+        tile, overlap = self.det_tile_size, self.det_tile_overlap
+        tiles = [
+            (y, x)
+            for y in _tile_starts(height, tile, overlap)
+            for x in _tile_starts(width, tile, overlap)
+        ]
+        views = [img_np[y:y + tile, x:x + tile] for y, x in tiles]
+        if self.det_only and not self.cascade and self.det_tile_batch > 1:
+            results = []
+            for i in range(0, len(views), self.det_tile_batch):
+                chunk = self._detect_batch(views[i:i + self.det_tile_batch])
+                results.extend((chunk_boxes, [None] * len(chunk_boxes)) for chunk_boxes in chunk)
+        else:
+            results = [self._run_detector(view) for view in views]
 
+        boxes, recs, tile_ids, tile_rects = [], [], [], []
+        for tile_id, ((y, x), view, (tile_boxes, tile_recs)) in enumerate(zip(tiles, views, results)):
+            tile_rects.append((x, y, x + view.shape[1], y + view.shape[0]))
+            for box, rec in zip(tile_boxes, tile_recs):
+                boxes.append([[pt[0] + x, pt[1] + y] for pt in box])
+                recs.append(rec)
+                tile_ids.append(tile_id)
+        merged, groups = _merge_tile_boxes(boxes, tile_ids, tile_rects)
+        # Box gộp từ nhiều tile không còn khớp với text Paddle của từng mảnh
+        merged_recs = [recs[g[0]] if len(g) == 1 else None for g in groups]
+        order = _reading_order(merged)
+        return [merged[i] for i in order], [merged_recs[i] for i in order]
+
+    def _detect_batch(self, views: List[np.ndarray]) -> List[list]:
+        """
+        Detector Paddle trên nhiều ảnh xám cùng kích thước trong một lần chạy
+        predictor: tiền xử lý và hậu xử lý DB của TextDetector dùng lại nguyên
+        vẹn (hậu xử lý vốn lặp theo batch), chỉ phần suy luận được gộp. Hoạt
+        động với cả predictor Paddle lẫn session ONNX (onnx_backend).
+        Tile mà tiền xử lý trả None (như TextDetector.__call__: ảnh suy biến)
+        không có box và không vào batch.
+        """
+        detector = self.paddle.text_detector
+        images, shapes, valid = [], [], []
+        for idx, view in enumerate(views):
+            data = {"image": cv2.cvtColor(np.ascontiguousarray(view), cv2.COLOR_GRAY2BGR)}
+            for op in detector.preprocess_op:
+                data = op(data)
+                if data is None:
+                    break
+            if data is None or data[0] is None:
+                continue
+            image, shape = data
+            images.append(image)
+            shapes.append(shape)
+            valid.append(idx)
+        results: List[list] = [[] for _ in views]
+        if not images:
+            return results
+        batch = np.stack(images)
+        if detector.use_onnx:
+            outputs = detector.predictor.run(
+                detector.output_tensors, {detector.input_tensor.name: batch}
+            )
+        else:
+            detector.input_tensor.copy_from_cpu(batch)
+            detector.predictor.run()
+            outputs = [tensor.copy_to_cpu() for tensor in detector.output_tensors]
+        post = detector.postprocess_op({"maps": outputs[0]}, np.stack(shapes))
+        for idx, result in zip(valid, post):
+            results[idx] = detector.filter_tag_det_res(result["points"], views[idx].shape).tolist()
+        return results
+
+    def _classify_crops(self, crops: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Angle classifier của Paddle trên các crop, xoay 180° dòng bị ngược.
+        """
+        classifier = self.paddle.text_classifier
+        _, cls_res, _ = classifier([cv2.cvtColor(np.ascontiguousarray(c), cv2.COLOR_GRAY2RGB) for c in crops])
+        thresh = self.paddle.args.cls_thresh
+        return [
+            np.ascontiguousarray(crop[::-1, ::-1]) if "180" in label and score > thresh else crop
+            for crop, (label, score) in zip(crops, cls_res)
+        ]
+
+    # ----------------- RECOG: LIST CROP → LIST TEXT (BATCH) -----------------
+    def _bucket_width(self, width: int) -> int:
+        if self.rec_bucket_width <= 0:
+            return width
+        max_width = self.vietocr.config["dataset"]["image_max_width"]
+        step = self.rec_bucket_width
+        return min(-(-width // step) * step, max(width, max_width))
+
+    def _recognize_crops(self, crops: List[np.ndarray]) -> List[str]:
+        """
+        Nhận dạng nhiều crop bằng VietOCR, gom theo độ rộng để chạy theo batch.
+        Kết quả trả về đúng thứ tự của `crops`.
+        """
+        if not crops:
+            return []
+
+        config = self.vietocr.config
+        # Beam search của VietOCR chỉ hỗ trợ từng ảnh một
+        if self.onnx_recognizer is None and (
+            self.rec_batch_size <= 1 or config["predictor"]["beamsearch"]
+        ):
+            return [self.vietocr.predict(Image.fromarray(crop)) for crop in crops]
+
+        dataset = config["dataset"]
+        inputs = []
+        buckets: Dict[int, List[int]] = defaultdict(list)
+        for idx, crop in enumerate(crops):
+            # Giống hệt tiền xử lý của Predictor.predict: cao cố định, rộng theo tỉ lệ
+            arr = process_image(
+                Image.fromarray(crop),
+                dataset["image_height"],
+                dataset["image_min_width"],
+                dataset["image_max_width"],
+            )
+            inputs.append(arr)
+            buckets[self._bucket_width(arr.shape[-1])].append(idx)
+
+        texts = [""] * len(crops)
+        for width, indices in sorted(buckets.items()):
+            for start in range(0, len(indices), self.rec_batch_size):
+                chunk = indices[start:start + self.rec_batch_size]
+                batch = np.ones(
+                    (len(chunk),) + inputs[chunk[0]].shape[:-1] + (width,),
+                    dtype=np.float64,
+                )
+                for row, idx in enumerate(chunk):
+                    arr = inputs[idx]
+                    batch[row, :, :, : arr.shape[-1]] = arr
+
+                if self.onnx_recognizer is not None:
+                    sents = self.onnx_recognizer.translate(batch)
+                else:
+                    tensor = torch.FloatTensor(batch).to(config["device"])
+                    sents, _ = translate(tensor, self.vietocr.model)
+                decoded = self.vietocr.vocab.batch_decode(sents.tolist())
+                for idx, text in zip(chunk, decoded):
+                    texts[idx] = text
+
+        return texts
+
+    def _join_lines(self, texts: List[str]) -> str:
+        lines = []
+        for text in texts:
+            text = self._postprocess_text(text)
+            if text:
+                lines.append(text)
         return "\n".join(lines)
 
+    # ----------------- CORE: OCR NHIỀU PIL IMAGE -----------------
+    def _ocr_pil_images(
+        self,
+        pil_imgs: List[Image.Image],
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[str]:
+        """
+        Detect từng ảnh, rồi nhận dạng toàn bộ crop của mọi ảnh chung các batch.
+        Trả về text của từng ảnh theo đúng thứ tự.
+        """
+        page_crops = []
+        for idx, pil_img in enumerate(pil_imgs):
+            if len(pil_imgs) > 1:
+                print(f"  Processing page {idx + 1}/{len(pil_imgs)}")
+            page_crops.append(self._detect_crops(pil_img, timings))
+
+        return self._recognize_pages(page_crops, timings)
+
+    def _iter_ocr_pages(
+        self,
+        tasks: Iterable[Dict[str, Any]],
+        timings: Optional[Dict[str, float]] = None,
+        total: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        OCR lần lượt các trang, mỗi trang là một dict:
+            {"page": số trang, "source": ..., "text": text có sẵn,
+             "images": [ảnh cần OCR của trang (cả trang hoặc từng vùng)],
+             "pixmaps": [pixmap giữ bộ nhớ cho ảnh numpy (tuỳ chọn)]}
+        Ảnh được detect ngay rồi giải phóng; crop của tối đa `rec_page_window`
+        trang được nhận dạng chung batch. Trả về từng trang theo thứ tự với
+        "text" = text có sẵn + text OCR của các ảnh (bỏ khoá "images").
+        """
+        window: List[Any] = []
+        for task in tasks:
+            images = task.pop("images")
+            if images:
+                print(f"  Processing page {task['page']}/{total or '?'}")
+            regions = []
+            densities = []
+            for img in images:
+                density = self._page_density(img, timings) if self.blank_filter else None
+                densities.append(density)
+                if density == "blank":
+                    # Trang / vùng trắng: bỏ qua tiền xử lý, detect và nhận dạng
+                    regions.append((None, "", []))
+                else:
+                    regions.append(self._detect_region(img, timings))
+            if task["source"] == "ocr" and densities and densities[0] is not None:
+                if densities[0] == "blank":
+                    task["source"] = "blank"
+                else:
+                    task["density"] = densities[0]
+            window.append((task, regions))
+            # Ảnh trang (và pixmap giữ bộ nhớ cho nó) không còn cần sau khi detect
+            task.pop("pixmaps", None)
+            del images
+            if len(window) >= self.rec_page_window:
+                yield from self._finish_pages(window, timings)
+                window = []
+        if window:
+            yield from self._finish_pages(window, timings)
+
+    def _detect_region(
+        self,
+        image: Union[Image.Image, np.ndarray],
+        timings: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Trả về (key cache, text đã cache hoặc None, crops cần nhận dạng).
+        """
+        key = None
+        if self.result_cache is not None:
+            with _stage(timings, "cache"):
+                if isinstance(image, np.ndarray):
+                    scope = f"page:{image.shape}"
+                else:
+                    scope = f"page:{image.mode}:{image.size}"
+                key = content_key(image.tobytes(), self.fingerprint, scope)
+                text = self.result_cache.get(key)
+            if text is not None:
+                return key, text, []
+        return key, None, self._detect_crops(image, timings)
+
+    def _finish_pages(
+        self, window: List[Any], timings: Optional[Dict[str, float]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        pending = [
+            crops
+            for _, page_regions in window
+            for _, cached, crops in page_regions
+            if cached is None
+        ]
+        recognized = iter(self._recognize_pages(pending, timings))
+
+        for task, page_regions in window:
+            if self.cascade:
+                lines = [c for _, cached, crops in page_regions if cached is None for c in crops]
+                paddle = sum(1 for c in lines if isinstance(c, str))
+                task["tiers"] = {"paddle": paddle, "vietocr": len(lines) - paddle}
+            texts = []
+            for key, cached, _ in page_regions:
+                if cached is None:
+                    cached = next(recognized)
+                    if key is not None:
+                        self.result_cache.put(key, cached)
+                texts.append(cached)
+            task["text"] = "\n".join(t for t in [task["text"]] + texts if t)
+            yield task
+
+    def _crop_key(self, crop: np.ndarray) -> bytes:
+        """
+        Hash của crop đã chuẩn hoá: cao 32px (giữ tỉ lệ), giãn tương phản về
+        0..255 rồi lượng tử còn 8 mức xám, để cùng một dòng in lặp lại (lệch
+        nhẹ độ sáng / nhiễu) cho cùng key. Vẫn là so khớp chính xác sau chuẩn
+        hoá, không phải so khớp gần đúng: crop lệch độ rộng sau khi đưa về cao
+        32px, hoặc có điểm ảnh nằm sát ranh giới hai mức xám, cho key khác.
+        """
+        arr = crop
+        height, width = arr.shape[:2]
+        target_h = 32
+        target_w = max(1, round(width * target_h / max(height, 1)))
+        arr = cv2.resize(arr, (target_w, target_h), interpolation=cv2.INTER_AREA)
+        low, high = int(arr.min()), int(arr.max())
+        if high > low:
+            arr = ((arr.astype(np.int32) - low) * 255 // (high - low)).astype(np.uint8)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(target_w.to_bytes(4, "little"))
+        h.update((arr >> 5).tobytes())
+        return h.digest()
+
+    def _new_document(self):
+        """Bắt đầu tài liệu mới: xoá cache crop nếu phạm vi theo tài liệu."""
+        if self.crop_cache is not None and self.crop_cache_scope == "document":
+            self.crop_cache.clear()
+
+    def _recognize_pages(
+        self,
+        page_crops: List[List[Union[np.ndarray, str]]],
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[str]:
+        """
+        Nhận dạng crop của nhiều trang chung các batch, trả text từng trang.
+        Phần tử là str (dòng Paddle đã nhận dạng ở chế độ cascade) giữ nguyên.
+        """
+        texts = [c for crops in page_crops for c in crops]
+        images = [i for i, c in enumerate(texts) if not isinstance(c, str)]
+        keys: Dict[bytes, List[int]] = {}
+        if self.crop_cache is not None and images:
+            with _stage(timings, "crop_cache"):
+                pending = []
+                hits = duplicates = 0
+                for i in images:
+                    key = self._crop_key(texts[i])
+                    cached = self.crop_cache.get(key)
+                    if cached is not None:
+                        texts[i] = cached
+                        hits += 1
+                    elif key in keys:
+                        keys[key].append(i)  # trùng crop khác trong cùng lượt
+                        duplicates += 1
+                    else:
+                        keys[key] = [i]
+                        pending.append(i)
+                if self._samples is not None:
+                    self._samples["crop_cache_hits"].append(hits)
+                    self._samples["crop_cache_duplicates"].append(duplicates)
+                    self._samples["crop_cache_misses"].append(len(pending))
+                images = pending
+        if self._samples is not None:
+            # Số crop thực sự qua VietOCR (không tính crop lấy từ cache / trùng)
+            self._samples["recognized_crops"].append(len(images))
+        with _stage(timings, "recognize"):
+            recognized = self._recognize_crops([texts[i] for i in images])
+        for i, text in zip(images, recognized):
+            texts[i] = text
+        for key, same in keys.items():
+            self.crop_cache.put(key, texts[same[0]])
+            for i in same[1:]:
+                texts[i] = texts[same[0]]
+
+        results = []
+        pos = 0
+        with _stage(timings, "postprocess"):
+            for crops in page_crops:
+                results.append(self._join_lines(texts[pos:pos + len(crops)]))
+                pos += len(crops)
+        return results
+
+    # ----------------- CORE: OCR 1 PIL IMAGE -----------------
+    def _ocr_pil_image(
+        self,
+        pil_img: Image.Image,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> str:
+        """
+        Nhận một PIL Image, chạy Paddle detect + VietOCR recog.
+        """
+        return self._ocr_pil_images([pil_img], timings)[0]
+
     # ----------------- ẢNH -----------------
-    def ocr_image(self, image_path: str) -> str:
+    def _open_image(self, source: Source) -> Image.Image:
+        if isinstance(source, str):
+            return Image.open(source).convert("RGB")
+        if _is_stream(source):
+            # PIL đọc dần từ file-like object, không cần bytes của cả file
+            source.seek(0)
+            return Image.open(source).convert("RGB")
+        return Image.open(io.BytesIO(source)).convert("RGB")
+
+    def _open_pdf(self, source: Source):
+        if isinstance(source, str):
+            return fitz.open(source)
+        if not _is_stream(source):
+            return fitz.open(stream=source, filetype="pdf")
+        # PyMuPDF 1.23 chỉ nhận stream bytes / bytearray / BytesIO (không nhận
+        # mmap, memoryview). SpooledTemporaryFile (UploadFile.file) bọc file
+        # thật hoặc BytesIO ở `_file`; gọi fileno() trên chính nó sẽ ép ghi ra
+        # đĩa nên dùng thẳng `_file`.
+        inner = getattr(source, "_file", source)
+        if isinstance(inner, io.BytesIO):
+            # Upload nhỏ (dưới ngưỡng spool) đang nằm trong bộ nhớ
+            return fitz.open(stream=inner, filetype="pdf")
+        path = _fd_path(inner)
+        if path is not None:
+            # MuPDF đọc thẳng từ file tạm trên đĩa, không copy vào bộ nhớ
+            return fitz.open(path, filetype="pdf")
+        source.seek(0)
+        return fitz.open(stream=source.read(), filetype="pdf")
+
+    def ocr_image_detailed(
+        self,
+        image: Source,
+        timings: Optional[Dict[str, float]] = None,
+        use_cache: bool = True,
+        on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        OCR 1 ảnh (đường dẫn, bytes hoặc file-like object), trả về dict
+        {"text", "pages"} giống `ocr_pdf_detailed` (ảnh được coi là tài liệu
+        một trang).
+        """
+        image = _as_input(image)
+
+        def compute():
+            print(f"📄 Processing image: {_source_name(image)}")
+            with _stage(timings, "load"):
+                pil_img = self._open_image(image)
+            task = {"page": 1, "source": "ocr", "text": "", "images": [pil_img]}
+            page = next(self._iter_ocr_pages([task], timings, 1))
+            if on_page is not None:
+                on_page(dict(page, total=1))
+            return {"text": page["text"], "pages": [page]}
+
+        return self._cached_document(image, compute, use_cache, on_page)
+
+    def ocr_image(
+        self, image_path: Source, timings: Optional[Dict[str, float]] = None
+    ) -> str:
         """
         OCR 1 ảnh (PNG, JPG...), trả về text tiếng Việt.
+        Nếu truyền `timings` (dict), thời gian từng bước (giây) được cộng dồn vào đó.
         """
-        print(f"📄 Processing image: {image_path}")
-        pil_img = Image.open(image_path).convert("RGB")
-        return self._ocr_pil_image(pil_img)
+        return self.ocr_image_detailed(image_path, timings)["text"]
 
-    # ----------------- PDF → LIST PIL IMAGES -----------------
-    def _pdf_to_images(self, pdf_path: str) -> List[Image.Image]:
+    # ----------------- CACHE KẾT QUẢ -----------------
+    def _document_key(self, source: Source) -> str:
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                return content_key(f, self.fingerprint)
+        return content_key(source, self.fingerprint)
+
+    def _cached_document(
+        self,
+        source: Source,
+        compute: Callable[[], Dict[str, Any]],
+        use_cache: bool = True,
+        on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
         """
-        Chuyển đổi các trang PDF thành hình ảnh.
+        Tra cache theo nội dung file; nếu chưa có thì chạy `compute` rồi lưu.
+        `compute` tự gọi `on_page` cho từng trang; với kết quả lấy từ cache thì
+        `on_page` được gọi lại cho mọi trang ở đây.
         """
-        images: List[Image.Image] = []
-        doc = fitz.open(pdf_path)
+        self._new_document()
+        if self.result_cache is None or not use_cache:
+            return compute()
 
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            # zoom 2.0 ~ 144 DPI, đủ nét
-            mat = fitz.Matrix(2.0, 2.0)
-            pix = page.get_pixmap(matrix=mat)
-
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data)).convert("RGB")
-
-            # Giới hạn kích thước để tránh quá to làm Paddle lỗi
-            max_side = 2000
-            w, h = img.size
-            scale = min(max_side / max(w, h), 1.0)
-            if scale < 1.0:
-                img = img.resize(
-                    (int(w * scale), int(h * scale)), Image.LANCZOS
-                )
+        key = self._document_key(source)
+        result = self.result_cache.get(key)
+        if result is not None:
+            print(f"⚡ Cache hit: {_source_name(source)}")
+            if on_page is not None:
+                total = len(result["pages"])
+                for page in result["pages"]:
+                    on_page(dict(page, total=total))
+            return result
+
+        result = compute()
+        self.result_cache.put(key, result)
+        return result
+
+    # ----------------- PDF → ẢNH -----------------
+    def _render_page(self, page, clip=None, gray: bool = True):
+        """
+        `render_pdf_page` với giới hạn cạnh dài 2000px; detect theo tile thì
+        ảnh lớn không còn là vấn đề → giữ nguyên zoom 2.0.
+        Trả về (mảng HxWxC, pixmap) — mảng là view trên bộ nhớ của pixmap nên
+        phải giữ pixmap sống cho đến khi dùng xong mảng.
+        """
+        max_side = float("inf") if self.det_tile_size else 2000
+        return render_pdf_page(page, clip=clip, gray=gray, max_side=max_side)
+
+    # ----------------- PDF: TEXT LAYER -----------------
+    def _native_text(self, page) -> str:
+        """
+        Lấy text có sẵn trong PDF, chuẩn hoá giống text OCR (mỗi dòng một dòng).
+        """
+        lines = (self._postprocess_text(line) for line in page.get_text("text").splitlines())
+        return "\n".join(line for line in lines if line)
+
+    def _image_regions(self, page) -> List[Any]:
+        """
+        Các vùng ảnh (fitz.Rect) trên trang, đã cắt theo khung trang.
+        """
+        regions = []
+        for info in page.get_image_info():
+            rect = fitz.Rect(info["bbox"]) & page.rect
+            if not rect.is_empty:
+                regions.append(rect)
+        return regions
 
-            images.append(img)
+    def _plan_page(self, page) -> Dict[str, Any]:
+        """
+        Quyết định cách xử lý một trang PDF:
+        - "text_layer": trang có text layer dùng được, không có ảnh đáng kể
+        - "mixed": text layer + OCR riêng các vùng ảnh lớn trên trang
+        - "ocr": trang scan / chỉ có ảnh → OCR cả trang
+        """
+        page_no = page.number + 1
+        if self.pdf_text_layer:
+            text = self._native_text(page)
+            page_area = abs(page.rect) or 1.0
+            regions = self._image_regions(page)
+            coverage = min(1.0, sum(abs(r) for r in regions) / page_area)
+            # Font không có bảng mã unicode sinh ra ký tự thay thế → text vô dụng
+            garbled = text.count("\ufffd") > 0.1 * len(text)
 
-        doc.close()
-        return images
+            if (
+                len(text) >= self.text_layer_min_chars
+                and not garbled
+                and coverage < self.ocr_coverage_threshold
+            ):
+                big_regions = [
+                    r for r in regions
+                    if abs(r) / page_area >= self.ocr_min_region
+                ]
+                if not big_regions:
+                    return {"page": page_no, "source": "text_layer", "text": text, "images": []}
+                rendered = [self._render_page(page, clip=r) for r in big_regions]
+                return {
+                    "page": page_no,
+                    "source": "mixed",
+                    "text": text,
+                    "images": [arr for arr, _ in rendered],
+                    "pixmaps": [pix for _, pix in rendered],
+                }
+
+        arr, pix = self._render_page(page)
+        return {"page": page_no, "source": "ocr", "text": "", "images": [arr], "pixmaps": [pix]}
+
+    def _plan_pages(
+        self, doc, timings: Optional[Dict[str, float]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        for page_num in range(len(doc)):
+            with _stage(timings, "render"):
+                task = self._plan_page(doc[page_num])
+            yield task
 
     # ----------------- PDF -----------------
-    def ocr_pdf(self, pdf_path: str) -> str:
+    def ocr_pdf_detailed(
+        self,
+        pdf: Source,
+        timings: Optional[Dict[str, float]] = None,
+        use_cache: bool = True,
+        on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
         """
-        OCR file PDF, trả về text từ tất cả các trang.
+        OCR file PDF (đường dẫn, bytes hoặc file-like object), trả về dict:
+            {"text": text mọi trang, "pages": [{"page", "source", "text"}, ...]}
+        "source" cho biết trang lấy từ text layer, OCR, hay cả hai ("mixed").
+        Trang được render dần (tối đa `pdf_prefetch` trang chờ sẵn) nên bộ nhớ
+        không tăng theo số trang.
+        Nếu truyền `timings` (dict), thời gian từng bước (giây) được cộng dồn vào đó.
+        use_cache=False bỏ qua cache mức tài liệu (vẫn dùng cache mức trang),
+        dùng khi nơi gọi đã tự tra cache theo nội dung file.
+        on_page(record) được gọi ngay khi mỗi trang xong, record gồm
+        {"page", "total", "source", "text"}; ném exception trong on_page để
+        dừng giữa chừng (vd. huỷ job).
         """
-        print(f"📄 Processing PDF: {pdf_path}")
+        pdf = _as_input(pdf)
 
-        images = self._pdf_to_images(pdf_path)
-        all_texts = []
+        def compute():
+            print(f"📄 Processing PDF: {_source_name(pdf)}")
 
-        for idx, img in enumerate(images):
-            print(f"  Processing page {idx + 1}/{len(images)}")
-            page_text = self._ocr_pil_image(img)
-            if page_text:
-                all_texts.append(f"--- Trang {idx + 1} ---\n{page_text}")
+            pages = []
+            doc = self._open_pdf(pdf)
+            try:
+                total = len(doc)
+                # Render trang N+1 trong thread nền trong khi OCR trang N
+                tasks = _prefetch(self._plan_pages(doc, timings), self.pdf_prefetch)
+                try:
+                    for page in self._iter_ocr_pages(tasks, timings, total):
+                        pages.append(page)
+                        if on_page is not None:
+                            on_page(dict(page, total=total))
+                finally:
+                    tasks.close()
+            finally:
+                doc.close()
 
-        return "\n\n".join(all_texts)
+            return self._pdf_result(pages)
+
+        return self._cached_document(pdf, compute, use_cache, on_page)
+
+    def _pdf_result(self, pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        all_texts = [
+            f"--- Trang {page['page']} ---\n{page['text']}"
+            for page in pages
+            if page["text"]
+        ]
+        return {"text": "\n\n".join(all_texts), "pages": pages}
+
+    def ocr_pdf(
+        self, pdf_path: Source, timings: Optional[Dict[str, float]] = None
+    ) -> str:
+        """
+        OCR file PDF, trả về text từ tất cả các trang.
+        """
+        return self.ocr_pdf_detailed(pdf_path, timings)["text"]
 
     # ----------------- AUTO -----------------
-    def process_file(self, file_path: str) -> str:
+    def process_file_detailed(
+        self,
+        source: Source,
+        timings: Optional[Dict[str, float]] = None,
+        use_cache: bool = True,
+        on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Như `process_file` nhưng trả về dict {"text", "pages"} giống
+        `ocr_pdf_detailed` (ảnh được coi là PDF một trang).
+        Với bytes / file-like object, định dạng được nhận theo chữ ký file.
+        """
+        source = _as_input(source)
+        if _is_pdf(source):
+            return self.ocr_pdf_detailed(source, timings, use_cache, on_page)
+        if isinstance(source, str):
+            ext = os.path.splitext(source)[1].lower()
+            if ext not in [".png", ".jpg", ".jpeg"]:
+                raise ValueError(f"Định dạng file không được hỗ trợ: {ext}")
+        return self.ocr_image_detailed(source, timings, use_cache, on_page)
+
+    def process_file(
+        self, file_path: Source, timings: Optional[Dict[str, float]] = None
+    ) -> str:
         """
         Tự nhận định dạng (PDF / PNG / JPG / JPEG) và OCR.
         """
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext == ".pdf":
-            return self.ocr_pdf(file_path)
-        elif ext in [".png", ".jpg", ".jpeg"]:
-            return self.ocr_image(file_path)
-        else:
-            raise ValueError(f"Định dạng file không được hỗ trợ: {ext}")
+        return self.process_file_detailed(file_path, timings)["text"]
+
+    # ----------------- ĐO ĐẠC -----------------
+    def measure(
+        self, method: str, *args, submitted_at: Optional[float] = None, **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Gọi `self.<method>(*args, **kwargs)` và trả về kết quả kèm số liệu:
+            {"result", "timings": {bước: giây}, "queue_wait": giây | None,
+             "samples": {"boxes_per_page", "crop_width", "crop_height", ...}}
+        Dùng khi gọi qua InferencePool: ở chế độ process, dict `timings`
+        truyền vào không về được process cha nên số liệu phải đi cùng kết quả.
+        submitted_at: time.time() lúc gửi việc, để tính thời gian chờ hàng đợi.
+        """
+        queue_wait = max(0.0, time.time() - submitted_at) if submitted_at else None
+        timings: Dict[str, float] = {}
+        self._samples = defaultdict(list)
+        try:
+            result = getattr(self, method)(*args, timings=timings, **kwargs)
+            samples = dict(self._samples)
+        finally:
+            self._samples = None
+        return {
+            "result": result,
+            "timings": timings,
+            "queue_wait": queue_wait,
+            "samples": samples,
+        }
+
+    # ----------------- BATCH NHIỀU FILE -----------------
+    def _plan_file(
+        self, source: Source, timings: Optional[Dict[str, float]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Các trang cần OCR của một file (dạng task của `_iter_ocr_pages`).
+        """
+        if _is_pdf(source):
+            doc = self._open_pdf(source)
+            try:
+                yield from self._plan_pages(doc, timings)
+            finally:
+                doc.close()
+            return
+        if isinstance(source, str):
+            ext = os.path.splitext(source)[1].lower()
+            if ext not in [".png", ".jpg", ".jpeg"]:
+                raise ValueError(f"Định dạng file không được hỗ trợ: {ext}")
+        with _stage(timings, "load"):
+            pil_img = self._open_image(source)
+        yield {"page": 1, "source": "ocr", "text": "", "images": [pil_img]}
+
+    def ocr_batch_detailed(
+        self,
+        sources: List[Source],
+        timings: Optional[Dict[str, float]] = None,
+        use_cache: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        OCR nhiều file (PDF / PNG / JPG / JPEG) trong một lượt. Trang của mọi
+        file đi chung một luồng nên crop của nhiều file nhỏ (vd. hoá đơn) được
+        nhận dạng chung batch VietOCR thay vì mỗi file một batch lẻ. Detector
+        của Paddle vẫn chạy từng ảnh.
+        Trả về list theo thứ tự `sources` (đường dẫn, bytes hoặc file-like),
+        mỗi phần tử là {"text", "pages"} như `process_file_detailed`, hoặc
+        {"error": ...} nếu file đó lỗi.
+        """
+        self._new_document()
+        sources = [_as_input(source) for source in sources]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(sources)
+        keys: List[Optional[str]] = [None] * len(sources)
+        todo = []
+        for idx, source in enumerate(sources):
+            if self.result_cache is not None and use_cache:
+                keys[idx] = self._document_key(source)
+                cached = self.result_cache.get(keys[idx])
+                if cached is not None:
+                    results[idx] = cached
+                    continue
+            todo.append(idx)
+
+        print(f"📦 Processing batch: {len(todo)} file(s), {len(sources) - len(todo)} cached")
+
+        def plan():
+            for idx in todo:
+                try:
+                    for task in self._plan_file(sources[idx], timings):
+                        task["file"] = idx
+                        yield task
+                except Exception as e:
+                    # File hỏng không làm hỏng cả batch
+                    results[idx] = {"error": str(e)}
+
+        pages: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        tasks = _prefetch(plan(), self.pdf_prefetch)
+        try:
+            for task in self._iter_ocr_pages(tasks, timings):
+                pages[task.pop("file")].append(task)
+        finally:
+            tasks.close()
+
+        for idx in todo:
+            if results[idx] is not None:
+                continue
+            if _is_pdf(sources[idx]):
+                results[idx] = self._pdf_result(pages[idx])
+            else:
+                results[idx] = {"text": pages[idx][0]["text"], "pages": pages[idx]}
+            if keys[idx] is not None:
+                self.result_cache.put(keys[idx], results[idx])
+        return results
+
+
+# Tham số không làm thay đổi kết quả OCR → không đưa vào fingerprint
+_FINGERPRINT_IGNORE = {
+    "rec_batch_size",
+    "cpu_threads",
+    "rec_page_window",
+    "pdf_prefetch",
+    "det_tile_batch",
+    "result_cache",
+    "onnx_dir",
+    # Cache crop chỉ tránh nhận dạng lại cùng một crop, không đổi kết quả
+    "crop_cache_size",
+    "crop_cache_scope",
+    # Bản sao cục bộ của đúng các model paddleocr / vietocr tải về (model_store.py)
+    "model_dir",
+}
+
+
+def _package_version(name: str) -> str:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def engine_fingerprint(**options) -> str:
+    """
+    Chuỗi định danh cấu hình engine (model + version + tham số ảnh hưởng
+    kết quả), dùng làm một phần key cache. `options` là tham số của
+    OCREngine(...); tham số không truyền lấy giá trị mặc định.
+    """
+    bound = inspect.signature(OCREngine.__init__).bind(None, **options)
+    bound.apply_defaults()
+    params = {
+        k: v
+        for k, v in bound.arguments.items()
+        if k != "self" and k not in _FINGERPRINT_IGNORE
+    }
+    params["recognizer"] = "vgg_transformer"
+    params["versions"] = {
+        pkg: _package_version(pkg) for pkg in ("paddleocr", "vietocr", "pymupdf")
+    }
+    return json.dumps(params, sort_keys=True, default=str)
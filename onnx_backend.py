@@ -0,0 +1,222 @@
+"""
+Backend ONNX Runtime cho VietOCR (vgg_transformer) và detector DB của PaddleOCR.
+
+- VietOCR được tách thành 2 model ONNX: encoder (CNN + transformer encoder) và
+  decoder (một bước giải mã), vòng lặp greedy chạy bằng numpy.
+- Detector: export model inference của Paddle bằng `paddle2onnx` (nếu chưa có
+  file .onnx) rồi thay predictor của `PaddleOCR.text_detector` bằng session
+  onnxruntime; pre/post-processing (resize, DB postprocess) vẫn của PaddleOCR.
+
+Export sẵn một lần (ví dụ trong Docker build):
+    python onnx_backend.py --out onnx_models
+"""
+import argparse
+import os
+import subprocess
+from typing import Optional, Tuple
+
+import numpy as np
+
+ENCODER_FILE = "vietocr_encoder.onnx"
+DECODER_FILE = "vietocr_decoder.onnx"
+DETECTOR_FILE = "paddle_det.onnx"
+
+
+def make_session(model_path: str, threads: Optional[int] = None):
+    """
+    Session onnxruntime CPU với số thread cố định (tránh oversubscription
+    khi chạy nhiều worker).
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(
+        model_path, sess_options=options, providers=["CPUExecutionProvider"]
+    )
+
+
+# ----------------- VIETOCR: EXPORT -----------------
+def export_vietocr(predictor, out_dir: str, opset: int = 14) -> Tuple[str, str]:
+    """
+    Export model VietOCR của `predictor` (vietocr Predictor) ra 2 file ONNX.
+    """
+    import torch
+
+    model = predictor.model.eval()
+
+    class Encoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.cnn = model.cnn
+            self.transformer = model.transformer
+
+        def forward(self, img):
+            return self.transformer.forward_encoder(self.cnn(img))
+
+    class Decoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.transformer = model.transformer
+
+        def forward(self, tgt, memory):
+            output, _ = self.transformer.forward_decoder(tgt, memory)
+            # Chỉ cần logits của bước cuối cho greedy decoding
+            return output[:, -1, :]
+
+    os.makedirs(out_dir, exist_ok=True)
+    encoder_path = os.path.join(out_dir, ENCODER_FILE)
+    decoder_path = os.path.join(out_dir, DECODER_FILE)
+    height = predictor.config["dataset"]["image_height"]
+
+    encoder = Encoder().eval()
+    decoder = Decoder().eval()
+    with torch.no_grad():
+        img = torch.rand(2, 3, height, 160)
+        torch.onnx.export(
+            encoder,
+            (img,),
+            encoder_path,
+            input_names=["img"],
+            output_names=["memory"],
+            dynamic_axes={"img": {0: "batch", 3: "width"}, "memory": {0: "seq", 1: "batch"}},
+            opset_version=opset,
+        )
+
+        memory = encoder(img)
+        tgt = torch.ones(3, 2, dtype=torch.long)  # (length, batch)
+        torch.onnx.export(
+            decoder,
+            (tgt, memory),
+            decoder_path,
+            input_names=["tgt", "memory"],
+            output_names=["logits"],
+            dynamic_axes={
+                "tgt": {0: "length", 1: "batch"},
+                "memory": {0: "seq", 1: "batch"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset,
+        )
+
+    print(f"✅ Exported VietOCR ONNX → {out_dir}")
+    return encoder_path, decoder_path
+
+
+# ----------------- VIETOCR: RUNTIME -----------------
+class OnnxRecognizer:
+    def __init__(
+        self,
+        encoder_path: str,
+        decoder_path: str,
+        threads: Optional[int] = None,
+        max_seq_length: int = 128,
+        sos_token: int = 1,
+        eos_token: int = 2,
+    ):
+        self.encoder = make_session(encoder_path, threads)
+        self.decoder = make_session(decoder_path, threads)
+        self.max_seq_length = max_seq_length
+        self.sos_token = sos_token
+        self.eos_token = eos_token
+
+    def translate(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Greedy decoding giống `vietocr.tool.translate.translate`.
+        batch: (N, 3, H, W) đã chuẩn hoá [0, 1]. Trả về token id (N, L).
+        """
+        memory = self.encoder.run(None, {"img": batch.astype(np.float32)})[0]
+        n = batch.shape[0]
+        tokens = np.full((1, n), self.sos_token, dtype=np.int64)
+        finished = np.zeros(n, dtype=bool)
+        for _ in range(self.max_seq_length + 1):
+            logits = self.decoder.run(None, {"tgt": tokens, "memory": memory})[0]
+            next_tokens = logits.argmax(axis=-1).astype(np.int64)
+            tokens = np.concatenate([tokens, next_tokens[None, :]], axis=0)
+            finished |= next_tokens == self.eos_token
+            if finished.all():
+                break
+        return tokens.T
+
+
+def load_recognizer(
+    predictor,
+    onnx_dir: str,
+    threads: Optional[int] = None,
+    quantize: str = "none",
+) -> OnnxRecognizer:
+    """
+    Nạp VietOCR ONNX từ `onnx_dir`, tự export nếu chưa có.
+    quantize: "none" (fp32), "dynamic" hoặc "static" (INT8, xem quantization.py).
+    """
+    encoder_path = os.path.join(onnx_dir, ENCODER_FILE)
+    decoder_path = os.path.join(onnx_dir, DECODER_FILE)
+    if not (os.path.exists(encoder_path) and os.path.exists(decoder_path)):
+        export_vietocr(predictor, onnx_dir)
+    if quantize != "none":
+        from quantization import quantize_recognizer
+
+        encoder_path, decoder_path = quantize_recognizer(onnx_dir, quantize)
+    return OnnxRecognizer(encoder_path, decoder_path, threads)
+
+
+# ----------------- PADDLE DETECTOR -----------------
+def export_paddle_det(det_model_dir: str, out_path: str, opset: int = 11) -> str:
+    """
+    Export model detector (thư mục inference của Paddle) sang ONNX bằng
+    paddle2onnx (`pip install paddle2onnx`).
+    """
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    subprocess.run(
+        [
+            "paddle2onnx",
+            "--model_dir", det_model_dir,
+            "--model_filename", "inference.pdmodel",
+            "--params_filename", "inference.pdiparams",
+            "--save_file", out_path,
+            "--opset_version", str(opset),
+            "--enable_onnx_checker", "True",
+        ],
+        check=True,
+    )
+    print(f"✅ Exported Paddle detector ONNX → {out_path}")
+    return out_path
+
+
+def attach_detector(paddle_ocr, onnx_dir: str, threads: Optional[int] = None):
+    """
+    Thay predictor Paddle của `paddle_ocr.text_detector` bằng session
+    onnxruntime. Tiền xử lý và DB postprocess vẫn do PaddleOCR đảm nhận.
+    """
+    det_path = os.path.join(onnx_dir, DETECTOR_FILE)
+    if not os.path.exists(det_path):
+        export_paddle_det(paddle_ocr.args.det_model_dir, det_path)
+
+    session = make_session(det_path, threads)
+    detector = paddle_ocr.text_detector
+    detector.use_onnx = True
+    detector.predictor = session
+    detector.input_tensor = session.get_inputs()[0]
+    detector.output_tensors = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export model OCR sang ONNX")
+    parser.add_argument("--out", default="onnx_models", help="Thư mục lưu file .onnx")
+    args = parser.parse_args()
+
+    from ocr_engine import OCREngine
+
+    engine = OCREngine(backend="native")
+    export_vietocr(engine.vietocr, args.out)
+    export_paddle_det(
+        engine.paddle.args.det_model_dir, os.path.join(args.out, DETECTOR_FILE)
+    )
+
+
+if __name__ == "__main__":
+    main()
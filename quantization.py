@@ -0,0 +1,287 @@
+"""
+Chế độ INT8 cho recognizer VietOCR + công cụ hiệu chuẩn và so sánh.
+
+- dynamic: lượng tử hoá trọng số INT8, activation tính lúc chạy.
+    + backend native: torch.quantization.quantize_dynamic trên các nn.Linear
+    + backend onnx: onnxruntime quantize_dynamic cho encoder + decoder
+- static (chỉ backend onnx): encoder lượng tử hoá tĩnh (QDQ) với dữ liệu hiệu
+  chuẩn lấy từ crop dòng của chính tài liệu của mình; decoder dùng dynamic.
+
+Ví dụ:
+    # 1. Lấy mẫu crop từ tài liệu để hiệu chuẩn
+    python quantization.py calibrate --docs samples/ --out onnx_models/calibration.npz
+    # 2. Tạo model INT8 (static cần file hiệu chuẩn ở bước 1)
+    python quantization.py quantize --mode static
+    # 3. So sánh CER / tốc độ với fp32 trên bộ ảnh local
+    python quantization.py compare --images eval_images/ --mode dynamic --backend onnx
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from evaluation import cer
+from onnx_backend import DECODER_FILE, ENCODER_FILE
+
+CALIBRATION_FILE = "calibration.npz"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def _int8_name(file_name: str, mode: str) -> str:
+    stem, ext = os.path.splitext(file_name)
+    return f"{stem}.int8-{mode}{ext}"
+
+
+# ----------------- NATIVE (PYTORCH) -----------------
+def quantize_torch_dynamic(model):
+    """
+    Lượng tử hoá động INT8 các lớp Linear (transformer) của model VietOCR.
+    """
+    import torch
+
+    return torch.quantization.quantize_dynamic(
+        model.eval(), {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+# ----------------- ONNX -----------------
+class _CropReader:
+    """CalibrationDataReader của onnxruntime, đọc crop từ file .npz."""
+
+    def __init__(self, calibration_path: str):
+        data = np.load(calibration_path)
+        self._items = iter([data[k] for k in data.files])
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        arr = next(self._items, None)
+        if arr is None:
+            return None
+        return {"img": arr[None].astype(np.float32)}
+
+
+def quantize_recognizer(onnx_dir: str, mode: str) -> Tuple[str, str]:
+    """
+    Trả về đường dẫn (encoder, decoder) INT8 trong `onnx_dir`, tạo nếu chưa có.
+    Cần có sẵn bản fp32 (onnx_backend.export_vietocr).
+    """
+    from onnxruntime.quantization import (
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+
+    if mode not in ("dynamic", "static"):
+        raise ValueError(f"Chế độ lượng tử hoá không hợp lệ: {mode}")
+
+    encoder_fp32 = os.path.join(onnx_dir, ENCODER_FILE)
+    decoder_fp32 = os.path.join(onnx_dir, DECODER_FILE)
+    encoder_int8 = os.path.join(onnx_dir, _int8_name(ENCODER_FILE, mode))
+    decoder_int8 = os.path.join(onnx_dir, _int8_name(DECODER_FILE, mode))
+
+    if not os.path.exists(encoder_int8):
+        if mode == "static":
+            calibration_path = os.path.join(onnx_dir, CALIBRATION_FILE)
+            if not os.path.exists(calibration_path):
+                raise FileNotFoundError(
+                    f"Thiếu dữ liệu hiệu chuẩn {calibration_path}. "
+                    "Chạy: python quantization.py calibrate --docs <thư mục tài liệu>"
+                )
+            quantize_static(
+                encoder_fp32,
+                encoder_int8,
+                _CropReader(calibration_path),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+            )
+        else:
+            quantize_dynamic(encoder_fp32, encoder_int8, weight_type=QuantType.QInt8)
+        print(f"✅ Quantized encoder ({mode}) → {encoder_int8}")
+
+    if not os.path.exists(decoder_int8):
+        # Decoder chạy từng bước với độ dài thay đổi → chỉ lượng tử hoá động
+        quantize_dynamic(decoder_fp32, decoder_int8, weight_type=QuantType.QInt8)
+        print(f"✅ Quantized decoder → {decoder_int8}")
+
+    return encoder_int8, decoder_int8
+
+
+# ----------------- HIỆU CHUẨN -----------------
+def _iter_document_images(paths: List[str]):
+    """Ảnh của từng trang trong các file PDF / ảnh."""
+    import fitz
+    from PIL import Image
+
+    for path in paths:
+        if path.lower().endswith(".pdf"):
+            doc = fitz.open(path)
+            try:
+                for page in doc:
+                    pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
+                    yield Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            finally:
+                doc.close()
+        else:
+            yield Image.open(path).convert("RGB")
+
+
+def _list_files(root: str, extensions) -> List[str]:
+    found = []
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.lower().endswith(extensions):
+                found.append(os.path.join(dirpath, name))
+    return sorted(found)
+
+
+def collect_calibration(
+    engine, docs_dir: str, out_path: str, max_crops: int = 300, seed: int = 0
+) -> int:
+    """
+    Detect dòng trên tài liệu trong `docs_dir`, lấy mẫu ngẫu nhiên tối đa
+    `max_crops` crop (đã chuẩn hoá như input VietOCR) và lưu vào `out_path`.
+    """
+    from PIL import Image
+    from vietocr.tool.translate import process_image
+
+    dataset = engine.vietocr.config["dataset"]
+    files = _list_files(docs_dir, IMAGE_EXTENSIONS + (".pdf",))
+    rng = random.Random(seed)
+    samples: List[np.ndarray] = []
+    seen = 0
+    for pil_img in _iter_document_images(files):
+        for crop in engine._detect_crops(pil_img):
+            if isinstance(crop, str):
+                continue  # dòng Paddle nhận dạng sẵn (cascade), không qua VietOCR
+            arr = process_image(
+                Image.fromarray(crop),
+                dataset["image_height"],
+                dataset["image_min_width"],
+                dataset["image_max_width"],
+            ).astype(np.float32)
+            # Reservoir sampling: mẫu đều trên toàn bộ crop, bộ nhớ cố định
+            seen += 1
+            if len(samples) < max_crops:
+                samples.append(arr)
+            else:
+                idx = rng.randrange(seen)
+                if idx < max_crops:
+                    samples[idx] = arr
+
+    if not samples:
+        raise ValueError(f"Không tìm thấy dòng chữ nào trong {docs_dir}")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    np.savez_compressed(out_path, **{f"crop_{i}": arr for i, arr in enumerate(samples)})
+    print(f"✅ Saved {len(samples)}/{seen} calibration crops → {out_path}")
+    return len(samples)
+
+
+# ----------------- SO SÁNH FP32 vs INT8 -----------------
+def _run_engine(engine, images: List[str]) -> Tuple[List[str], float, float]:
+    from PIL import Image
+
+    texts = []
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    for path in images:
+        texts.append(engine._ocr_pil_image(Image.open(path).convert("RGB"), timings))
+    return texts, time.perf_counter() - start, timings.get("recognize", 0.0)
+
+
+def compare(images_dir: str, mode: str, engine_options: dict) -> dict:
+    """
+    Chạy engine fp32 và INT8 trên cùng bộ ảnh, báo cáo:
+    - cer_vs_fp32: độ lệch ký tự của INT8 so với kết quả fp32
+    - cer_vs_truth: CER so với ground truth (file .txt cùng tên ảnh), nếu có
+    - thời gian tổng / thời gian nhận dạng và tốc độ tăng
+    """
+    from ocr_engine import OCREngine
+
+    images = _list_files(images_dir, IMAGE_EXTENSIONS)
+    if not images:
+        raise ValueError(f"Không có ảnh trong {images_dir}")
+    truths = {}
+    for path in images:
+        truth_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as f:
+                truths[path] = f.read()
+
+    runs = {}
+    for label, quantize in (("fp32", "none"), ("int8", mode)):
+        engine = OCREngine(**engine_options, rec_quantize=quantize)
+        _run_engine(engine, images[:1])  # warm-up
+        runs[label] = _run_engine(engine, images)
+        del engine
+
+    fp32_texts, fp32_total, fp32_rec = runs["fp32"]
+    int8_texts, int8_total, int8_rec = runs["int8"]
+    report = {
+        "mode": mode,
+        "images": len(images),
+        "cer_vs_fp32": float(np.mean([cer(a, b) for a, b in zip(fp32_texts, int8_texts)])),
+        "fp32": {"total_s": fp32_total, "recognize_s": fp32_rec,
+                 "images_per_s": len(images) / fp32_total},
+        "int8": {"total_s": int8_total, "recognize_s": int8_rec,
+                 "images_per_s": len(images) / int8_total},
+        "speedup_total": fp32_total / int8_total,
+        "speedup_recognize": fp32_rec / int8_rec if int8_rec else None,
+    }
+    if truths:
+        for label, texts in (("fp32", fp32_texts), ("int8", int8_texts)):
+            report[label]["cer_vs_truth"] = float(np.mean([
+                cer(truths[path], text)
+                for path, text in zip(images, texts)
+                if path in truths
+            ]))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 cho recognizer VietOCR")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_cal = sub.add_parser("calibrate", help="Lấy mẫu crop từ tài liệu để hiệu chuẩn")
+    p_cal.add_argument("--docs", required=True, help="Thư mục PDF / ảnh mẫu")
+    p_cal.add_argument("--out", default=os.path.join("onnx_models", CALIBRATION_FILE))
+    p_cal.add_argument("--max-crops", type=int, default=300)
+
+    p_q = sub.add_parser("quantize", help="Tạo model ONNX INT8")
+    p_q.add_argument("--onnx-dir", default="onnx_models")
+    p_q.add_argument("--mode", choices=["dynamic", "static"], default="dynamic")
+
+    p_cmp = sub.add_parser("compare", help="So sánh CER / tốc độ fp32 vs INT8")
+    p_cmp.add_argument("--images", required=True, help="Thư mục ảnh (+ .txt ground truth)")
+    p_cmp.add_argument("--mode", choices=["dynamic", "static"], default="dynamic")
+    p_cmp.add_argument("--backend", choices=["native", "onnx"], default="native")
+    p_cmp.add_argument("--onnx-dir", default="onnx_models")
+    p_cmp.add_argument("--report", help="Ghi báo cáo JSON ra file")
+
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        from ocr_engine import OCREngine
+
+        collect_calibration(OCREngine(), args.docs, args.out, args.max_crops)
+    elif args.command == "quantize":
+        quantize_recognizer(args.onnx_dir, args.mode)
+    else:
+        report = compare(
+            args.images,
+            args.mode,
+            {"backend": args.backend, "onnx_dir": args.onnx_dir},
+        )
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
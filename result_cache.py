@@ -0,0 +1,224 @@
+"""
+Cache kết quả OCR theo nội dung (content-addressed).
+
+Key = hash(nội dung file / trang + fingerprint cấu hình engine), nên cùng một
+file upload lại (retry, gửi trùng, cùng template) trả kết quả ngay mà không
+chạy lại OCR. Hai tầng:
+- bộ nhớ: LRU giới hạn theo dung lượng
+- đĩa (tuỳ chọn): thư mục JSON dùng chung giữa các process, xoá file cũ nhất
+  khi vượt dung lượng
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+
+def content_key(data: Union[bytes, BinaryIO], fingerprint: str, scope: str = "doc") -> str:
+    """
+    Key cache cho `data` (bytes của file hoặc của ảnh trang, hoặc file-like
+    object — đọc theo từng khối 1 MB, không nạp cả file) ứng với cấu hình
+    engine `fingerprint`. `scope` tách key tài liệu ("doc") và trang ("page").
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(fingerprint.encode("utf-8"))
+    h.update(b"\0" + scope.encode("utf-8") + b"\0")
+    if hasattr(data, "read"):
+        data.seek(0)
+        for chunk in iter(lambda: data.read(1024 * 1024), b""):
+            h.update(chunk)
+        data.seek(0)
+    else:
+        h.update(data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        """
+        max_bytes: dung lượng tối đa tầng bộ nhớ (tính theo JSON đã encode).
+        disk_dir: thư mục tầng đĩa; None = chỉ dùng bộ nhớ.
+        disk_max_bytes: dung lượng tối đa tầng đĩa.
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    # ----------------- BỘ NHỚ -----------------
+    def _memory_put(self, key: str, blob: bytes):
+        if len(blob) > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = blob
+        self._memory_bytes += len(blob)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._evictions += 1
+
+    # ----------------- ĐĨA -----------------
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            os.utime(path)  # đánh dấu vừa dùng (LRU theo mtime)
+            return blob
+        except FileNotFoundError:
+            return None
+
+    def _disk_put(self, key: str, blob: bytes):
+        if len(blob) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, path)  # ghi nguyên tử, an toàn giữa nhiều process
+        self._disk_bytes += len(blob)
+        if self._disk_bytes > self.disk_max_bytes:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        # Quét lại thư mục vì các process khác cũng ghi vào
+        entries = sorted(self._disk_entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = int(self.disk_max_bytes * 0.9)
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                self._evictions += 1
+            except FileNotFoundError:
+                continue
+        self._disk_bytes = total
+
+    # ----------------- API -----------------
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return json.loads(blob)
+
+            if self.disk_dir:
+                blob = self._disk_get(key)
+                if blob is not None:
+                    self._hits += 1
+                    self._disk_hits += 1
+                    self._memory_put(key, blob)
+                    return json.loads(blob)
+
+            self._misses += 1
+            return None
+
+    def put(self, key: str, value: Any):
+        """`value` phải serialize được sang JSON."""
+        blob = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._memory_put(key, blob)
+            if self.disk_dir:
+                try:
+                    self._disk_put(key, blob)
+                except OSError as e:
+                    print(f"⚠️ Không ghi được cache xuống đĩa: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes if self.disk_dir else 0,
+            }
+
+
+class CropCache:
+    """
+    LRU text theo key của crop dòng (xem OCREngine._crop_key), giới hạn theo
+    số entry. Dòng lặp lại (header, footer, nhãn biểu mẫu) chỉ tốn một lần tra
+    dict thay vì một lượt forward VietOCR.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, str]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: bytes) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return text
+
+    def put(self, key: bytes, text: str):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Xoá entry (phạm vi theo tài liệu), giữ số liệu hit / miss."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,73 @@
+"""
+Test bộ lọc trang trắng (`_classify_density`) trên trang scan tổng hợp,
+không cần load model:
+
+    python -m pytest test_blank_filter.py
+"""
+import inspect
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from ocr_engine import OCREngine, _classify_density
+
+PAGE_SHAPE = (1600, 1132)  # (cao, rộng) ~ A4 ở 135 DPI
+BACKGROUND = 235
+
+
+def _defaults():
+    params = inspect.signature(OCREngine.__init__).parameters
+    return tuple(
+        params[name].default
+        for name in ("blank_ink_ratio", "blank_faint_ratio", "sparse_ink_ratio")
+    )
+
+
+def _scan(seed: int = 0):
+    """Giấy trắng ngà có hạt nhiễu và bóng mờ ở mép trái (mép gáy)."""
+    rng = np.random.default_rng(seed)
+    page = rng.normal(BACKGROUND, 3, PAGE_SHAPE)
+    page[:, :40] -= np.linspace(20, 0, 40)
+    return page
+
+
+def _write(page, darkness: float, seed: int = 0):
+    """Vẽ các dòng "chữ" nét mảnh 2px, tối hơn nền `darkness` mức xám."""
+    rng = np.random.default_rng(seed)
+    for top in range(150, 1450, 50):
+        x = 120
+        while x < 1000:
+            width = int(rng.integers(40, 140))
+            for stroke in range(x, x + width, 7):
+                page[top:top + 24, stroke:stroke + 2] -= darkness
+            page[top + 11:top + 13, x:x + width] -= darkness
+            x += width + 25
+    return page
+
+
+def _density(page) -> str:
+    # Giống đường ảnh PIL của OCREngine._page_density
+    image = Image.fromarray(np.clip(page, 0, 255).astype(np.uint8))
+    factor = max(1, max(image.size) // 320)
+    thumbnail = np.asarray(image.reduce(factor).convert("L"))
+    return _classify_density(thumbnail, *_defaults())
+
+
+def test_clean_blank_page_is_skipped():
+    assert _density(_scan()) == "blank"
+
+
+def test_show_through_is_still_blank():
+    # Mặt sau để trống của bản scan 2 mặt: chữ mặt trước in hằn qua rất nhạt
+    assert _density(_write(_scan(), darkness=18)) == "blank"
+
+
+def test_faint_text_is_not_skipped():
+    # Bản photo mờ: chữ không đạt ngưỡng mực nhưng phải được detect
+    assert _density(_write(_scan(), darkness=35)) == "sparse"
+
+
+def test_printed_page_is_normal():
+    assert _density(_write(_scan(), darkness=180)) == "normal"